@@ -0,0 +1,71 @@
+"""
+Benchmark PDF text extraction throughput for 1..N worker processes
+
+Usage:
+    python bench_pdf_extract.py textbook.pdf [--max-workers 8] [--pages-per-task 8] [--repeat 3]
+
+Reports pages/sec for serial extraction (1 worker) and the process pool
+(2..N workers), using the same code paths as /upload.
+"""
+import argparse
+import mmap
+import os
+import time
+from services.pdf_processor import PDFProcessor, _get_extract_pool
+
+
+def extract_serial(pdf_path: str) -> int:
+    with open(pdf_path, "rb") as pdf_file, mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as pdf_map:
+        pdf_reader, _ = PDFProcessor.open_pdf(pdf_map)
+        return sum(len(page_text) for page_text in PDFProcessor.iter_page_texts(pdf_reader))
+
+
+def extract_parallel(pdf_path: str, total_pages: int, workers: int, pages_per_task: int) -> int:
+    return sum(
+        len(page_text)
+        for page_text in PDFProcessor.iter_page_texts_parallel(pdf_path, total_pages, workers, pages_per_task)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF extraction pages/sec benchmark")
+    parser.add_argument("pdf_path")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.pdf_path, "rb") as pdf_file:
+        _, total_pages = PDFProcessor.open_pdf(pdf_file)
+    print(f"{args.pdf_path}: {total_pages} pages")
+    print(f"{'workers':>8} {'best s':>10} {'pages/s':>10} {'speedup':>8}")
+
+    baseline = None
+    expected_chars = None
+    for workers in range(1, args.max_workers + 1):
+        if workers > 1:
+            # Start the pool outside the timed runs
+            _get_extract_pool(workers).submit(int).result()
+
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            if workers == 1:
+                chars = extract_serial(args.pdf_path)
+            else:
+                chars = extract_parallel(args.pdf_path, total_pages, workers, args.pages_per_task)
+            timings.append(time.perf_counter() - started)
+
+            # Parallel output must match the serial extraction
+            if expected_chars is None:
+                expected_chars = chars
+            elif chars != expected_chars:
+                raise SystemExit(f"Extracted {chars} characters with {workers} workers, expected {expected_chars}")
+
+        best = min(timings)
+        baseline = baseline or best
+        print(f"{workers:>8} {best:>10.3f} {total_pages / best:>10.1f} {baseline / best:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
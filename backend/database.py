@@ -1,3 +1,4 @@
+import gridfs
 from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
@@ -15,10 +16,35 @@ class Database:
     def get_chunks_collection(self):
         return self.db.chunks
     
+    def get_jobs_collection(self):
+        return self.db.embedding_jobs
+    
+    def get_embedding_cache_collection(self):
+        return self.db.embedding_cache
+    
+    def get_answer_cache_collection(self):
+        return self.db.answer_cache
+    
+    def get_book_text_bucket(self):
+        return gridfs.GridFSBucket(self.db, bucket_name="book_text")
+    
+    def get_raw_text_bucket(self):
+        return gridfs.GridFSBucket(self.db, bucket_name="book_raw_text")
+    
     def create_indexes(self):
         """Create database indexes for better performance"""
         # Index for chunks by book_id
         self.db.chunks.create_index("book_id")
+        # Index for paging a book's chunks in order (embedding batches)
+        self.db.chunks.create_index([("book_id", 1), ("chunk_index", 1)])
+        # Index for the vector index sync, which polls recently embedded chunks
+        self.db.chunks.create_index("embedded_at")
+        # Index for duplicate upload detection by PDF fingerprint
+        self.db.books.create_index(
+            "content_hash",
+            unique=True,
+            partialFilterExpression={"content_hash": {"$exists": True}}
+        )
         # Index for text search (optional)
         self.db.chunks.create_index([("content", "text")])
 
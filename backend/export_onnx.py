@@ -0,0 +1,158 @@
+"""
+Export the embedding model to ONNX for the onnxruntime CPU backend
+
+Usage:
+    python export_onnx.py export [--model all-MiniLM-L6-v2] [--output onnx_models/all-MiniLM-L6-v2]
+    python export_onnx.py parity [--model-file model_quantized.onnx] [--min-cosine 0.99] [--min-top1 1.0] [--min-top3 0.9]
+
+Then run the API with EMBEDDING_BACKEND=onnx (ONNX_MODEL_DIR / ONNX_MODEL_FILE
+select a non-default location or the unquantized model.onnx).
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+# Covers short queries, long textbook passages, page markers and Indic scripts
+PARITY_SENTENCES = [
+    "What is photosynthesis?",
+    "explain photosynthesis",
+    "Newton's third law of motion states that every action has an equal and opposite reaction.",
+    "--- Page 12 --- Chapter 3: Cell Structure and Function",
+    "The mitochondria is the powerhouse of the cell, producing ATP through cellular respiration. " * 8,
+    "प्रकाश संश्लेषण क्या है?",
+    "ஒளிச்சேர்க்கை என்றால் என்ன?",
+    "1.2 Rational Numbers: a number that can be expressed as p/q where q is not zero",
+    "",
+    "Define: (a) osmosis (b) diffusion",
+]
+
+# Questions ranked against PARITY_SENTENCES to compare retrieval between backends
+PARITY_QUERIES = [
+    "how do plants make food from sunlight",
+    "action and reaction forces",
+    "what does the mitochondria do",
+    "what are rational numbers",
+    "difference between osmosis and diffusion",
+    "कोशिका की संरचना",
+]
+
+
+def export_model(model_name: str, output_dir: str, quantize: bool):
+    """Export the transformer with dynamic axes and optionally int8-quantize it"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    sentence_model = SentenceTransformer(model_name, device="cpu")
+    transformer = sentence_model[0].auto_model.eval()
+    tokenizer = sentence_model.tokenizer
+
+    # tokenizer.json is what the fast (Rust) tokenizer loads at runtime
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_path = os.path.join(output_dir, "model.onnx")
+    torch.onnx.export(
+        transformer,
+        tuple(sample[name] for name in input_names),
+        model_path,
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic_axes,
+        opset_version=14
+    )
+    print(f"Exported {model_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_path = os.path.join(output_dir, "model_quantized.onnx")
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"Quantized model written to {quantized_path}")
+
+
+def check_parity(model_name: str, model_dir: str, model_file: str, min_cosine: float, min_top1: float, min_top3: float) -> bool:
+    """
+    Compare the ONNX backend against SentenceTransformer on PARITY_SENTENCES
+    Returns: True if every sentence's embeddings agree to at least min_cosine
+    """
+    from sentence_transformers import SentenceTransformer
+    from services.onnx_encoder import OnnxSentenceEncoder
+
+    torch_model = SentenceTransformer(model_name, device="cpu")
+    onnx_model = OnnxSentenceEncoder(model_dir, model_file)
+
+    started = time.perf_counter()
+    expected = torch_model.encode(PARITY_SENTENCES, convert_to_tensor=False, normalize_embeddings=True)
+    torch_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = onnx_model.encode(PARITY_SENTENCES)
+    onnx_seconds = time.perf_counter() - started
+
+    expected_queries = torch_model.encode(PARITY_QUERIES, convert_to_tensor=False, normalize_embeddings=True)
+    actual_queries = onnx_model.encode(PARITY_QUERIES)
+
+    cosines = np.sum(expected * actual, axis=1)
+    for sentence, cosine in zip(PARITY_SENTENCES, cosines):
+        status = "ok" if cosine >= min_cosine else "FAIL"
+        print(f"[{status}] cosine={cosine:.5f}  {sentence[:60]!r}")
+
+    # Retrieval parity: both backends should rank the corpus the same way for each query
+    expected_ranking = np.argsort(-(expected_queries @ expected.T), axis=1)
+    actual_ranking = np.argsort(-(actual_queries @ actual.T), axis=1)
+    top1_agreement = np.mean(expected_ranking[:, 0] == actual_ranking[:, 0])
+    top3_overlap = np.mean([
+        len(set(expected_top) & set(actual_top)) / 3
+        for expected_top, actual_top in zip(expected_ranking[:, :3], actual_ranking[:, :3])
+    ])
+
+    print(f"min cosine {cosines.min():.5f}, mean cosine {cosines.mean():.5f}")
+    print(f"{len(PARITY_QUERIES)} queries: top-1 agreement {top1_agreement:.0%}, top-3 overlap {top3_overlap:.0%}")
+    print(f"torch {torch_seconds * 1000:.1f}ms, onnx ({model_file}) {onnx_seconds * 1000:.1f}ms")
+
+    passed = True
+    for name, value, minimum in (
+        ("min cosine", cosines.min(), min_cosine),
+        ("top-1 agreement", top1_agreement, min_top1),
+        ("top-3 overlap", top3_overlap, min_top3)
+    ):
+        if value < minimum:
+            print(f"FAIL: {name} {value:.5f} is below {minimum}")
+            passed = False
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX export for the embedding service")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export (and quantize) the model")
+    export_parser.add_argument("--output", default=None)
+    export_parser.add_argument("--no-quantize", action="store_true")
+
+    parity_parser = subparsers.add_parser("parity", help="Check ONNX embeddings against torch")
+    parity_parser.add_argument("--model-dir", default=None)
+    parity_parser.add_argument("--model-file", default="model_quantized.onnx")
+    parity_parser.add_argument("--min-cosine", type=float, default=0.99)
+    parity_parser.add_argument("--min-top1", type=float, default=1.0, help="Share of queries whose best match must agree")
+    parity_parser.add_argument("--min-top3", type=float, default=0.9, help="Mean overlap of the top-3 matches")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_model(args.model, args.output or os.path.join("onnx_models", args.model), not args.no_quantize)
+    elif args.command == "parity":
+        model_dir = args.model_dir or os.path.join("onnx_models", args.model)
+        if not check_parity(args.model, model_dir, args.model_file, args.min_cosine, args.min_top1, args.min_top3):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,34 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from database import database
-from models.book import Book
 from models.search import SearchQuery, SearchResult
-from services.pdf_processor import PDFProcessor
 from services.embeddings import embedding_service
+from services.embedding_batcher import embedding_batcher
 # Also add ObjectId import at the top
 from bson import ObjectId
 from typing import List, Optional
 from services.gemini_client import gemini_client
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from services.murf_client import murf_client
+from services.vector_index import vector_index
+from services.embedding_codec import decode_embedding, embedding_format
+from services.job_queue import embedding_jobs, serialize_job
+from services.ingestion import ingest_pdf_file
+from services.text_store import book_text_store, raw_text_store
+from services.concurrency import db_stage, ingest_stage, gemini_stage, murf_stage, UpstreamBusyError, upstream_priority, BULK
+from services.audio_cache import audio_cache
+from services.voice_pipeline import voice_pipeline
+from services.answer_cache import answer_cache
+from services.semantic_cache import semantic_cache
 # import aiofiles
 import os
+import asyncio
+import hashlib
+import json
+import tempfile
+import time
+from pymongo.errors import DuplicateKeyError
 
 
 app = FastAPI()
@@ -28,121 +43,362 @@ app.add_middleware(
 )
 
 # Mount static files for audio
-app.mount("/audio", StaticFiles(directory="audio_files"), name="audio")
-def generate_embeddings_background(book_id: str):
-    """Background task to generate embeddings for chunks"""
+app.mount("/audio", StaticFiles(directory=audio_cache.audio_dir), name="audio")
+
+
+@app.exception_handler(UpstreamBusyError)
+async def upstream_busy_handler(request: Request, exc: UpstreamBusyError):
+    """Gemini or Murf is saturated: fail fast and tell the client when to come back"""
+    print(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+VECTOR_INDEX_SYNC_SECONDS = float(os.getenv("VECTOR_INDEX_SYNC_SECONDS", "5"))
+AUDIO_CACHE_EVICT_SECONDS = float(os.getenv("AUDIO_CACHE_EVICT_SECONDS", "300"))
+TTS_MAX_TEXT_CHARS = int(os.getenv("TTS_MAX_TEXT_CHARS", "20000"))
+NO_CONTENT_ANSWER = "No textbook content available to answer this question. Please upload some textbooks first."
+
+
+@app.on_event("startup")
+def load_vector_index():
+    """Load (or build) the resident vector index once so queries never rescan MongoDB"""
     try:
-        chunks_collection = database.get_chunks_collection()
-        
-        # Get all chunks for this book that don't have embeddings
-        chunks = list(chunks_collection.find({
-            "book_id": book_id,
-            "embedding": {"$exists": False}
-        }))
-        
-        if not chunks:
-            print(f"No chunks need embeddings for book {book_id}")
-            return
-        
-        print(f"Generating embeddings for {len(chunks)} chunks...")
-        
-        # Extract texts
-        texts = [chunk['content'] for chunk in chunks]
-        
-        # Generate embeddings in batch
-        embeddings = embedding_service.generate_embeddings_batch(texts)
-        
-        # Update chunks with embeddings
-        for i, chunk in enumerate(chunks):
-            chunks_collection.update_one(
-                {"_id": chunk["_id"]},
-                {"$set": {"embedding": embeddings[i]}}
-            )
-        
-        print(f"Successfully generated embeddings for {len(chunks)} chunks")
-        
+        vector_index.load(database.get_chunks_collection(), database.get_books_collection())
     except Exception as e:
-        print(f"Error generating embeddings: {e}")
+        print(f"Warning: Could not load vector index: {e}")
+
+
+@app.on_event("startup")
+async def start_vector_index_sync():
+    """Pick up embeddings written by worker processes"""
+    async def sync_loop():
+        while True:
+            await asyncio.sleep(VECTOR_INDEX_SYNC_SECONDS)
+            try:
+                await db_stage.run(
+                    vector_index.sync, database.get_chunks_collection(), database.get_books_collection()
+                )
+            except Exception as e:
+                print(f"Warning: Vector index sync failed: {e}")
+
+    asyncio.get_running_loop().create_task(sync_loop())
+
+
+@app.on_event("startup")
+async def start_audio_cache_eviction():
+    """Keep the audio directory under its byte budget and TTL"""
+    async def eviction_loop():
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, audio_cache.evict)
+            except Exception as e:
+                print(f"Warning: Audio cache eviction failed: {e}")
+            await asyncio.sleep(AUDIO_CACHE_EVICT_SECONDS)
+
+    asyncio.get_running_loop().create_task(eviction_loop())
+
+
+@app.on_event("shutdown")
+def save_vector_index():
+    """Persist incremental index changes so the next start doesn't rebuild"""
+    try:
+        vector_index.save()
+    except Exception as e:
+        print(f"Warning: Could not save vector index: {e}")
+
+
+@app.on_event("shutdown")
+async def close_murf_client():
+    """Close the pooled Murf connections"""
+    if murf_client:
+        await murf_client.close()
+
+
+def retrieve_similar_chunks(
+    query_embedding: List[float],
+    book_ids: Optional[List[str]],
+    top_k: int,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None
+) -> List[dict]:
+    """
+    Rank chunks against the resident index and fetch only the top_k documents
+    Returns: Chunk documents (without embeddings) with 'similarity_score', best first
+    """
+    ranked = vector_index.search(query_embedding, top_k, book_ids, ef_search=ef_search, nprobe=nprobe)
+    if not ranked:
+        return []
+
+    chunks_collection = database.get_chunks_collection()
+    chunk_docs = {
+        chunk["_id"]: chunk
+        for chunk in chunks_collection.find(
+            {"_id": {"$in": [chunk_id for chunk_id, _ in ranked]}},
+            {"embedding": 0}
+        )
+    }
+
+    similar_chunks = []
+    for chunk_id, score in ranked:
+        chunk = chunk_docs.get(chunk_id)
+        if chunk is None:
+            continue  # Deleted since the index was updated
+        chunk['similarity_score'] = score
+        similar_chunks.append(chunk)
+
+    # Chunks stored as offsets get their text only once they made the top_k
+    return book_text_store.materialize(similar_chunks)
+
+
+def book_filenames_by_id(book_ids: List[str]) -> dict:
+    """Map book ids to their filenames"""
+    if not book_ids:
+        return {}
+    books_collection = database.get_books_collection()
+    return {
+        str(book['_id']): book['filename']
+        for book in books_collection.find(
+            {"_id": {"$in": [ObjectId(bid) for bid in book_ids]}},
+            {"filename": 1}
+        )
+    }
+
+
+def format_source_chunks(chunks: List[dict], books: dict) -> List[dict]:
+    """Source chunks as shown to the frontend next to an answer"""
+    return [
+        {
+            "chunk_id": str(chunk['_id']),
+            "content": chunk['content'][:300] + "..." if len(chunk['content']) > 300 else chunk['content'],
+            "similarity_score": round(chunk['similarity_score'], 3),
+            "book_filename": books.get(chunk['book_id'], 'Unknown'),
+            "chapter": chunk.get('chapter'),
+            "section": chunk.get('section')
+        }
+        for chunk in chunks
+    ]
+
+
+async def retrieve_answer_context(search_query: SearchQuery, query_embedding: Optional[List[float]] = None) -> Optional[dict]:
+    """
+    Embed a question (unless its embedding is given) and gather the chunks its answer is grounded on
+    Returns: None when no chunks are indexed in scope, otherwise the chunks above
+    min_similarity with their book filenames and formatted sources
+    """
+    if query_embedding is None:
+        query_embedding = await embedding_batcher.embed(search_query.query)
+    
+    if not await db_stage.run(vector_index.count, search_query.book_ids):
+        return None
+    
+    similar_chunks = await db_stage.run(
+        retrieve_similar_chunks, query_embedding, search_query.book_ids, search_query.top_k,
+        ef_search=search_query.ef_search, nprobe=search_query.nprobe
+    )
+    filtered_chunks = [
+        chunk for chunk in similar_chunks 
+        if chunk['similarity_score'] >= search_query.min_similarity
+    ]
+    
+    books = await db_stage.run(book_filenames_by_id, list(set(chunk['book_id'] for chunk in filtered_chunks)))
+    return {
+        "chunks": filtered_chunks,
+        "book_filenames": [books.get(chunk['book_id'], 'Unknown') for chunk in filtered_chunks],
+        "sources": format_source_chunks(filtered_chunks, books)
+    }
+
+
+def answer_cache_key(query: str, book_ids: Optional[List[str]], language: str, chunks: List[dict]) -> Optional[str]:
+    """Answer cache key for a question and the chunks retrieved for it (None when caching is off)"""
+    if not answer_cache:
+        return None
+    return answer_cache.key(query, book_ids, language, [chunk['_id'] for chunk in chunks])
+
+
+async def cached_answer(key: Optional[str]) -> Optional[dict]:
+    return await db_stage.run(answer_cache.get, key) if key else None
+
+
+async def remember_answer(key: Optional[str], answer: dict):
+    if key:
+        await db_stage.run(answer_cache.put, key, answer)
+
 
+def semantic_answer(query_embedding: List[float], book_ids: Optional[List[str]], language: str, index_version: int) -> Optional[dict]:
+    """Cached answer to an earlier question close in meaning to this one (same scope and language)"""
+    if not semantic_cache:
+        return None
+    hit = semantic_cache.lookup(query_embedding, book_ids, language, index_version)
+    if hit:
+        print(f"Semantic cache hit ({hit['similarity']}): {hit['query']}")
+    return hit
 
 
+def remember_semantic_answer(
+    query_embedding: List[float], book_ids: Optional[List[str]], language: str, index_version: int, query: str, response: dict
+):
+    if semantic_cache:
+        semantic_cache.add(query_embedding, book_ids, language, index_version, query, response)
+
+
+def semantic_hit_fields(hit: dict) -> dict:
+    """Response fields telling the client which earlier question was matched"""
+    return {"cached": True, "matched_query": hit["query"], "similarity": hit["similarity"]}
+
+
+def semantic_audio(response: dict, voice_id: str) -> Optional[dict]:
+    """Audio stored with a cached answer, if it is in this voice and the file still exists"""
+    audio = response.get("audio")
+    if not audio or not audio.get("success") or response.get("voice_used") != voice_id:
+        return None
+    return audio if os.path.exists(audio_cache.path(audio["audio_filename"])) else None
+
+
+async def replay_answer(answer: str):
+    """A cached answer as a one-chunk stream"""
+    yield answer
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "database": "connected"}
 
-@app.post("/upload")
-async def upload_pdf(file: UploadFile = File(...),background_tasks: BackgroundTasks = BackgroundTasks()):
-    # Validate file type
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-    
-    # Read PDF content
-    pdf_content = await file.read()
+UPLOAD_READ_SIZE = 1024 * 1024
+
+
+def existing_upload_response(book: dict, filename: str) -> dict:
+    """Upload response for a PDF that was already processed, without re-extracting or re-embedding"""
+    books_collection = database.get_books_collection()
+    chunks_collection = database.get_chunks_collection()
+    book_id = str(book["_id"])
     
-    # Extract text using PDF processor
-    raw_text, total_pages = PDFProcessor.extract_text_from_pdf(pdf_content)
+    # Remember the new name this PDF was uploaded as
+    if filename != book["filename"]:
+        books_collection.update_one({"_id": book["_id"]}, {"$addToSet": {"aliases": filename}})
     
-    # Create book object and save to MongoDB
-    book = Book(file.filename, total_pages, raw_text)
-    books_collection = database.get_books_collection()
-    result = books_collection.insert_one(book.to_dict())
-    book_id = str(result.inserted_id)
+    total_chunks = chunks_collection.count_documents({"book_id": book_id})
+    embedded_chunks = chunks_collection.count_documents({"book_id": book_id, "embedding": {"$exists": True}})
+    chunk_stats = list(chunks_collection.aggregate([
+        {"$match": {"book_id": book_id}},
+        {"$group": {"_id": None, "avg_chunk_size": {"$avg": "$char_count"}}}
+    ]))
+    first_chunk = chunks_collection.find_one(
+        {"book_id": book_id},
+        {"book_id": 1, "content": 1, "text_start": 1, "text_end": 1},
+        sort=[("chunk_index", 1)]
+    )
+    if first_chunk:
+        book_text_store.materialize([first_chunk])
+    job = embedding_jobs.latest_for_book(book_id)
     
-    # Create chunks
-    chunks = PDFProcessor.chunk_text(raw_text, book_id)
+    if total_chunks and embedded_chunks == total_chunks:
+        embeddings_status = "completed"
+    elif job and job["state"] in ("queued", "running"):
+        embeddings_status = job["state"]
+    else:
+        embeddings_status = "incomplete" if total_chunks else "no_chunks"
     
-    # Save chunks to MongoDB
-    if chunks:
-        chunks_collection = database.get_chunks_collection()
-        chunk_dicts = [chunk.to_dict() for chunk in chunks]
-        chunks_collection.insert_many(chunk_dicts)
+    return {
+        "success": True,
+        "duplicate": True,
+        "book_id": book_id,
+        "filename": book["filename"],
+        "uploaded_as": filename,
+        "total_pages": book["total_pages"],
+        "text_length": book["text_length"],
+        "chunks_created": total_chunks,
+        "embedded_chunks": embedded_chunks,
+        "average_chunk_size": int(chunk_stats[0]["avg_chunk_size"] or 0) if chunk_stats else 0,
+        "chunk_preview": first_chunk["content"][:200] + "..." if first_chunk else "No chunks created",
+        "embeddings_status": embeddings_status,
+        "embedding_job_id": str(job["_id"]) if job else None
+    }
 
-        # Generate embeddings in background
-        background_tasks.add_task(generate_embeddings_background, book_id)
 
+@app.post("/upload")
+async def upload_pdf(file: UploadFile = File(...)):
+    # Validate file type
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    
+    # Spool the PDF to disk, fingerprinting it as it streams in
+    fingerprint = hashlib.sha256()
+    spool = tempfile.NamedTemporaryFile(prefix="upload_", suffix=".pdf", delete=False)
+    try:
+        with spool:
+            while True:
+                block = await file.read(UPLOAD_READ_SIZE)
+                if not block:
+                    break
+                fingerprint.update(block)
+                spool.write(block)
+        content_hash = fingerprint.hexdigest()
+        
+        if os.path.getsize(spool.name) == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        
+        # Same PDF uploaded before: reuse its book, chunks and embeddings
+        books_collection = database.get_books_collection()
+        existing_book = await db_stage.run(books_collection.find_one, {"content_hash": content_hash}, {"raw_text": 0})
+        if existing_book:
+            print(f"Duplicate upload of {file.filename}, matches book {existing_book['_id']}")
+            return await db_stage.run(existing_upload_response, existing_book, file.filename)
+        
+        # Extract, chunk and store page by page, off the event loop
+        try:
+            ingested = await ingest_stage.run(ingest_pdf_file, spool.name, file.filename, content_hash)
+        except DuplicateKeyError:
+            # A concurrent upload of the same PDF got there first
+            existing_book = await db_stage.run(books_collection.find_one, {"content_hash": content_hash}, {"raw_text": 0})
+            return await db_stage.run(existing_upload_response, existing_book, file.filename)
+    finally:
+        os.unlink(spool.name)
     
-    # Calculate chunk statistics
-    total_chunks = len(chunks)
-    avg_chunk_size = sum(chunk.char_count for chunk in chunks) // total_chunks if total_chunks > 0 else 0
+    # Queue embedding generation for the worker processes
+    embedding_job = await db_stage.run(embedding_jobs.enqueue, ingested["book_id"]) if ingested["chunks_created"] else None
     
     # Return success with enhanced info
     return {
         "success": True,
-        "book_id": book_id,
+        "duplicate": False,
         "filename": file.filename,
-        "total_pages": total_pages,
-        "text_length": len(raw_text),
-        "text_preview": raw_text[:500] + "..." if len(raw_text) > 500 else raw_text,
-        "chunks_created": total_chunks,
-        "average_chunk_size": avg_chunk_size,
-        "chunk_preview": chunks[0].content[:200] + "..." if chunks else "No chunks created",
-        "embeddings_status": "generating_in_background"
+        **ingested,
+        "embeddings_status": "queued" if embedding_job else "no_chunks",
+        "embedding_job_id": str(embedding_job["_id"]) if embedding_job else None
     }
 
 # Add this temporary endpoint to main.py for manual embedding generation
 @app.post("/generate-all-embeddings")
-async def generate_all_embeddings(background_tasks: BackgroundTasks):
+def generate_all_embeddings():
     """Generate embeddings for all books that don't have them"""
     chunks_collection = database.get_chunks_collection()
     
-    # Find all chunks without embeddings
-    chunks_without_embeddings = list(chunks_collection.find({"embedding": {"$exists": False}}))
+    # Count chunks without embeddings and the books they belong to
+    chunks_without_embeddings = chunks_collection.count_documents({"embedding": {"$exists": False}})
     
     if not chunks_without_embeddings:
         return {"message": "All chunks already have embeddings"}
     
-    # Group by book_id
-    book_ids = list(set(chunk['book_id'] for chunk in chunks_without_embeddings))
+    book_ids = chunks_collection.distinct("book_id", {"embedding": {"$exists": False}})
     
-    # Generate embeddings for each book
-    for book_id in book_ids:
-        background_tasks.add_task(generate_embeddings_background, book_id)
+    # Queue a job for each book (books with an active job keep it)
+    jobs = [embedding_jobs.enqueue(book_id) for book_id in book_ids]
     
     return {
-        "message": f"Started embedding generation for {len(book_ids)} books",
-        "chunks_to_process": len(chunks_without_embeddings),
-        "book_ids": book_ids
+        "message": f"Queued embedding generation for {len(book_ids)} books",
+        "chunks_to_process": chunks_without_embeddings,
+        "book_ids": book_ids,
+        "job_ids": [str(job["_id"]) for job in jobs]
     }
 
 
@@ -156,89 +412,77 @@ async def ask_question(search_query: SearchQuery):
         raise HTTPException(status_code=500, detail="Gemini client not available")
     
     try:
-        # First, search for relevant chunks
-        query_embedding = embedding_service.generate_embedding(search_query.query)
+        query_embedding = await embedding_batcher.embed(search_query.query)
+        index_version = vector_index.version(search_query.book_ids)
         
-        mongo_query = {"embedding": {"$exists": True}}
-        if search_query.book_ids:
-            mongo_query["book_id"] = {"$in": search_query.book_ids}
+        # A question close in meaning to one already answered gets that answer
+        hit = semantic_answer(query_embedding, search_query.book_ids, "en-US", index_version)
+        if hit:
+            return {**hit["response"], "query": search_query.query, **semantic_hit_fields(hit)}
         
-        chunks_collection = database.get_chunks_collection()
-        chunks = list(chunks_collection.find(mongo_query))
+        # First, search for relevant chunks
+        context = await retrieve_answer_context(search_query, query_embedding)
         
-        if not chunks:
+        if context is None:
             return {
                 "success": False,
-                "answer": "No textbook content available to answer this question. Please upload some textbooks first.",
+                "answer": NO_CONTENT_ANSWER,
                 "query": search_query.query,
                 "sources": [],
                 "chunks_used": []
             }
         
-        # Find similar chunks
-        similar_chunks = embedding_service.find_similar_chunks(
-            query_embedding, chunks, search_query.top_k
-        )
-        
-        # Filter by similarity threshold
-        filtered_chunks = [
-            chunk for chunk in similar_chunks 
-            if chunk['similarity_score'] >= search_query.min_similarity
-        ]
+        filtered_chunks = context["chunks"]
+        cache_key = answer_cache_key(search_query.query, search_query.book_ids, "en-US", filtered_chunks)
+        cached = await cached_answer(cache_key)
         
         if not filtered_chunks:
             # Fallback: use simple Gemini response
-            answer = gemini_client.generate_simple_response(search_query.query)
-            return {
-                "success": True,
-                "answer": f"Based on general knowledge: {answer}",
+            simple_response = cached or await gemini_client.generate_simple_response(search_query.query)
+            if not cached and simple_response["success"]:
+                await remember_answer(cache_key, simple_response)
+            response = {
+                "success": simple_response["success"],
+                "answer": f"Based on general knowledge: {simple_response['answer']}" if simple_response["success"] else simple_response["answer"],
                 "query": search_query.query,
                 "sources": [],
                 "chunks_used": [],
-                "note": "No highly relevant textbook content found. This is a general response."
+                "note": "No highly relevant textbook content found. This is a general response.",
+                "cached": cached is not None
             }
+            if response["success"]:
+                remember_semantic_answer(query_embedding, search_query.book_ids, "en-US", index_version, search_query.query, response)
+            return response
         
-        # Get book filenames for context
-        books_collection = database.get_books_collection()
-        book_ids = list(set(chunk['book_id'] for chunk in filtered_chunks))
-        books = {}
+        book_filenames = context["book_filenames"]
         
-        if book_ids:
-            books_cursor = books_collection.find(
-                {"_id": {"$in": [ObjectId(bid) for bid in book_ids]}}
+        # Generate AI response using Gemini (unless this exact question was just answered)
+        gemini_response = cached
+        if gemini_response is None:
+            gemini_response = await gemini_client.generate_educational_response(
+                search_query.query, 
+                filtered_chunks, 
+                book_filenames
             )
-            books = {str(book['_id']): book['filename'] for book in books_cursor}
-        
-        book_filenames = [books.get(chunk['book_id'], 'Unknown') for chunk in filtered_chunks]
-        
-        # Generate AI response using Gemini
-        gemini_response = gemini_client.generate_educational_response(
-            search_query.query, 
-            filtered_chunks, 
-            book_filenames
-        )
+            if gemini_response["success"]:
+                await remember_answer(cache_key, gemini_response)
         
-        # Format source chunks for frontend
-        source_chunks = []
-        for chunk in filtered_chunks:
-            source_chunks.append({
-                "chunk_id": str(chunk['_id']),
-                "content": chunk['content'][:300] + "..." if len(chunk['content']) > 300 else chunk['content'],
-                "similarity_score": round(chunk['similarity_score'], 3),
-                "book_filename": books.get(chunk['book_id'], 'Unknown'),
-                "chapter": chunk.get('chapter'),
-                "section": chunk.get('section')
-            })
-        
-        return {
+        response = {
             "success": gemini_response["success"],
             "answer": gemini_response["answer"],
             "query": search_query.query,
             "sources": list(set(book_filenames)),
-            "chunks_used": source_chunks,
-            "total_chunks_found": len(filtered_chunks)
+            "chunks_used": context["sources"],
+            "total_chunks_found": len(filtered_chunks),
+            "prompt_tokens": gemini_response.get("prompt_tokens"),
+            "cached": cached is not None
         }
+        if response["success"]:
+            remember_semantic_answer(query_embedding, search_query.book_ids, "en-US", index_version, search_query.query, response)
+        return response
         
+    except UpstreamBusyError:
+        raise
     except Exception as e:
         print(f"Ask question error: {e}")
         import traceback
@@ -246,6 +490,131 @@ async def ask_question(search_query: SearchQuery):
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
 
 
+@app.post("/ask/stream")
+async def ask_question_stream(search_query: SearchQuery):
+    """
+    Ask a question and stream the answer as server-sent events
+    Events: 'sources' (retrieved chunks, sent before generation starts),
+    'token' (answer text as Gemini produces it), then 'done' with timings or 'error'
+    """
+    print(f"=== ASK STREAM CALLED ===")
+    print(f"Query: {search_query.query}")
+    
+    if not gemini_client:
+        raise HTTPException(status_code=500, detail="Gemini client not available")
+    
+    started = time.perf_counter()
+    try:
+        query_embedding = await embedding_batcher.embed(search_query.query)
+        index_version = vector_index.version(search_query.book_ids)
+        hit = semantic_answer(query_embedding, search_query.book_ids, "en-US", index_version)
+        context = None if hit else await retrieve_answer_context(search_query, query_embedding)
+    except Exception as e:
+        print(f"Ask stream retrieval error: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+    retrieval_ms = round((time.perf_counter() - started) * 1000, 1)
+    
+    async def events():
+        if hit:
+            # A question close in meaning was already answered, replay that answer
+            response = hit["response"]
+            yield sse_event("sources", {
+                "query": search_query.query,
+                "sources": response["sources"],
+                "chunks_used": response["chunks_used"],
+                "total_chunks_found": response.get("total_chunks_found", 0)
+            })
+            yield sse_event("token", {"text": response["answer"]})
+            yield sse_event("done", {
+                "success": True,
+                "answer": response["answer"],
+                "note": response.get("note"),
+                **semantic_hit_fields(hit),
+                "timing": {"retrieval_ms": retrieval_ms, "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+            })
+            return
+        
+        if context is None:
+            yield sse_event("sources", {"query": search_query.query, "sources": [], "chunks_used": []})
+            yield sse_event("done", {"success": False, "answer": NO_CONTENT_ANSWER, "timing": {"retrieval_ms": retrieval_ms}})
+            return
+        
+        yield sse_event("sources", {
+            "query": search_query.query,
+            "sources": list(set(context["book_filenames"])),
+            "chunks_used": context["sources"],
+            "total_chunks_found": len(context["chunks"])
+        })
+        
+        note = None
+        prefix = ""
+        if not context["chunks"]:
+            # Same fallback as /ask: a general answer, flagged as such
+            note = "No highly relevant textbook content found. This is a general response."
+            prefix = "Based on general knowledge: "
+            yield sse_event("token", {"text": prefix})
+        
+        cache_key = answer_cache_key(search_query.query, search_query.book_ids, "en-US", context["chunks"])
+        cached = await cached_answer(cache_key)
+        answer_parts = []
+        first_token_ms = None
+        prompt_tokens = None
+        try:
+            if cached:
+                answer_parts.append(cached["answer"])
+                first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                yield sse_event("token", {"text": cached["answer"]})
+            else:
+                prompt = gemini_client.build_prompt(search_query.query, context["chunks"], context["book_filenames"])
+                prompt_tokens = gemini_client.prompt_tokens(prompt)
+                async for text in gemini_client.stream_response(prompt):
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                    answer_parts.append(text)
+                    yield sse_event("token", {"text": text})
+                if not "".join(answer_parts).strip():
+                    # Blocked or empty generation, never cache it as an answer
+                    yield sse_event("error", {"message": "No answer was generated for this question"})
+                    return
+                await remember_answer(cache_key, {"success": True, "answer": "".join(answer_parts)})
+        except UpstreamBusyError as e:
+            yield sse_event("error", {"message": str(e), "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            print(f"Ask stream generation error: {e}")
+            yield sse_event("error", {"message": f"Error generating response: {str(e)}"})
+            return
+        
+        answer = prefix + "".join(answer_parts)
+        remember_semantic_answer(query_embedding, search_query.book_ids, "en-US", index_version, search_query.query, {
+            "success": True,
+            "answer": answer,
+            "query": search_query.query,
+            "sources": list(set(context["book_filenames"])),
+            "chunks_used": context["sources"],
+            "total_chunks_found": len(context["chunks"]),
+            "note": note
+        })
+        yield sse_event("done", {
+            "success": True,
+            "answer": answer,
+            "note": note,
+            "prompt_tokens": prompt_tokens,
+            "cached": cached is not None,
+            "timing": {
+                "retrieval_ms": retrieval_ms,
+                "first_token_ms": first_token_ms,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+        })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 
 @app.post("/search")
 async def search_chunks(search_query: SearchQuery):
@@ -254,25 +623,20 @@ async def search_chunks(search_query: SearchQuery):
     
     try:
         # Generate embedding for query
-        query_embedding = embedding_service.generate_embedding(search_query.query)
+        query_embedding = await embedding_batcher.embed(search_query.query)
         print(f"Generated query embedding of length: {len(query_embedding)}")
         
-        # Build MongoDB query
-        mongo_query = {"embedding": {"$exists": True}}
-        if search_query.book_ids:
-            mongo_query["book_id"] = {"$in": search_query.book_ids}
-        
-        # Get chunks with embeddings
-        chunks_collection = database.get_chunks_collection()
-        chunks = list(chunks_collection.find(mongo_query))
-        print(f"Found {len(chunks)} chunks with embeddings")
+        # Check the resident index has chunks in scope
+        indexed_chunks = await db_stage.run(vector_index.count, search_query.book_ids)
+        print(f"Found {indexed_chunks} chunks with embeddings")
         
-        if not chunks:
+        if not indexed_chunks:
             return {"results": [], "message": "No chunks with embeddings found", "query": search_query.query}
         
         # Find similar chunks
-        similar_chunks = embedding_service.find_similar_chunks(
-            query_embedding, chunks, search_query.top_k
+        similar_chunks = await db_stage.run(
+            retrieve_similar_chunks, query_embedding, search_query.book_ids, search_query.top_k,
+            ef_search=search_query.ef_search, nprobe=search_query.nprobe
         )
         print(f"Found {len(similar_chunks)} similar chunks")
         
@@ -284,14 +648,8 @@ async def search_chunks(search_query: SearchQuery):
         print(f"Filtered to {len(filtered_chunks)} chunks above threshold")
         
         # Get book filenames for results
-        books_collection = database.get_books_collection()
         book_ids = list(set(chunk['book_id'] for chunk in filtered_chunks))
-        books = {
-            str(book['_id']): book['filename'] 
-            for book in books_collection.find(
-                {"_id": {"$in": [ObjectId(bid) for bid in book_ids]}}
-            )
-        }
+        books = await db_stage.run(book_filenames_by_id, book_ids)
         
         # Format results
         results = []
@@ -319,21 +677,36 @@ async def search_chunks(search_query: SearchQuery):
         raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
 
 @app.post("/books/{book_id}/generate-embeddings")
-async def manually_generate_embeddings(book_id: str, background_tasks: BackgroundTasks):
+def manually_generate_embeddings(book_id: str):
     """Manually trigger embedding generation for a book"""
-    background_tasks.add_task(generate_embeddings_background, book_id)
-    return {"message": "Embedding generation started", "book_id": book_id}
+    job = embedding_jobs.enqueue(book_id)
+    return {"message": "Embedding generation queued", "book_id": book_id, "job": serialize_job(job)}
+
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    """Get the state of an embedding job"""
+    job = embedding_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return serialize_job(job)
+
+
+@app.get("/jobs")
+def get_job_counts():
+    """Number of embedding jobs in each state"""
+    return embedding_jobs.counts()
 
 
 
 @app.get("/books")
-async def get_all_books():
+def get_all_books():
     """Get list of all uploaded books"""
     books_collection = database.get_books_collection()
     chunks_collection = database.get_chunks_collection()
     
     books = list(books_collection.find({}, {
-        "raw_text": 0  # Exclude raw_text for performance
+        "raw_text": 0  # Only books not yet migrated to the raw text store still carry it
     }))
     
     # Add chunk count and embedding status for each book
@@ -361,9 +734,10 @@ async def get_all_books():
 
 
 @app.get("/books/{book_id}/embedding-status")
-async def get_embedding_status(book_id: str):
+def get_embedding_status(book_id: str):
     """Check embedding generation status for a book"""
     chunks_collection = database.get_chunks_collection()
+    books_collection = database.get_books_collection()
     
     total_chunks = chunks_collection.count_documents({"book_id": book_id})
     embedded_chunks = chunks_collection.count_documents({
@@ -371,21 +745,30 @@ async def get_embedding_status(book_id: str):
         "embedding": {"$exists": True}
     })
     
+    # Batch-level progress recorded by the embedding pipeline
+    book = None
+    if ObjectId.is_valid(book_id):
+        book = books_collection.find_one({"_id": ObjectId(book_id)}, {"embedding_progress": 1})
+    
     return {
         "book_id": book_id,
         "total_chunks": total_chunks,
         "embedded_chunks": embedded_chunks,
         "progress_percentage": round((embedded_chunks / total_chunks) * 100, 2) if total_chunks > 0 else 0,
-        "status": "completed" if embedded_chunks == total_chunks else "in_progress"
+        "status": "completed" if embedded_chunks == total_chunks else "in_progress",
+        "embedding_progress": book.get("embedding_progress") if book else None,
+        "job": serialize_job(embedding_jobs.latest_for_book(book_id))
     }
 
 
 
 @app.get("/books/{book_id}/chunks")
-async def get_book_chunks(book_id: str):
+def get_book_chunks(book_id: str):
     """Get all chunks for a specific book"""
     chunks_collection = database.get_chunks_collection()
-    chunks = list(chunks_collection.find({"book_id": book_id}))
+    chunks = book_text_store.materialize(
+        list(chunks_collection.find({"book_id": book_id}, {"embedding": 0}).sort("chunk_index", 1))
+    )
     
     # Convert ObjectId to string
     for chunk in chunks:
@@ -400,18 +783,20 @@ async def get_book_chunks(book_id: str):
 # Add this new endpoint after your existing ones
 
 @app.get("/books/{book_id}/stats")
-async def get_book_stats(book_id: str):
+def get_book_stats(book_id: str):
     """Get detailed statistics for debugging"""
     books_collection = database.get_books_collection()
     chunks_collection = database.get_chunks_collection()
     
     # Get book info
-    book = books_collection.find_one({"_id": ObjectId(book_id)})
+    book = books_collection.find_one({"_id": ObjectId(book_id)}, {"filename": 1, "text_length": 1})
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     
     # Get chunk stats
-    chunks = list(chunks_collection.find({"book_id": book_id}))
+    chunks = list(chunks_collection.find({"book_id": book_id}, {"embedding": 0}).sort("chunk_index", 1))
+    if chunks:
+        book_text_store.materialize([chunks[0], chunks[-1]])
     
     chunk_sizes = [chunk['char_count'] for chunk in chunks]
     total_chunk_chars = sum(chunk_sizes)
@@ -430,8 +815,23 @@ async def get_book_stats(book_id: str):
         "last_chunk_preview": chunks[-1]["content"][:200] + "..." if chunks else None
     }
 
+@app.get("/books/{book_id}/text")
+def get_book_text(book_id: str):
+    """Stream the full extracted text of a book"""
+    if not ObjectId.is_valid(book_id):
+        raise HTTPException(status_code=404, detail="Book not found")
+    
+    if raw_text_store.has_text(book_id):
+        return StreamingResponse(raw_text_store.iter_text(book_id), media_type="text/plain")
+    
+    # Books uploaded before the raw text store (until migrate.py book-text is run)
+    book = database.get_books_collection().find_one({"_id": ObjectId(book_id)}, {"raw_text": 1})
+    if not book or "raw_text" not in book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return StreamingResponse(iter([book["raw_text"]]), media_type="text/plain")
+
 @app.get("/debug/search-ready")
-async def debug_search_ready():
+def debug_search_ready():
     """Debug endpoint to check if search is ready"""
     chunks_collection = database.get_chunks_collection()
     
@@ -446,9 +846,68 @@ async def debug_search_ready():
         "total_chunks": total_chunks,
         "embedded_chunks": embedded_chunks,
         "embedding_ready": embedded_chunks > 0,
-        "sample_embedding_length": len(sample_chunk.get("embedding", [])) if sample_chunk else 0
+        "sample_embedding_length": len(decode_embedding(sample_chunk["embedding"])) if sample_chunk else 0,
+        "sample_embedding_format": embedding_format(sample_chunk["embedding"]) if sample_chunk else None
     }
 
+@app.get("/debug/embedding-batcher")
+async def debug_embedding_batcher():
+    """Debug endpoint with query embedding micro-batching metrics"""
+    return embedding_batcher.stats()
+
+@app.get("/debug/embedding-cache")
+def debug_embedding_cache():
+    """Debug endpoint with content-hash embedding cache metrics"""
+    if not embedding_service.cache:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_service.cache.stats()}
+
+@app.get("/debug/concurrency")
+async def debug_concurrency():
+    """Debug endpoint with per-stage concurrency metrics for the request path"""
+    return {
+        "db": db_stage.stats(),
+        "ingest": ingest_stage.stats(),
+        "gemini": gemini_stage.stats(),
+        "murf": murf_stage.stats(),
+        "embedding": embedding_batcher.stats(),
+        "coalescing": {
+            "gemini": gemini_client.single_flight.stats() if gemini_client else None,
+            "murf": murf_client.single_flight.stats() if murf_client else None
+        }
+    }
+
+@app.get("/debug/audio-cache")
+async def debug_audio_cache():
+    """Debug endpoint with TTS audio cache metrics"""
+    return audio_cache.stats()
+
+@app.get("/debug/answer-cache")
+async def debug_answer_cache():
+    """Debug endpoint with answer cache metrics"""
+    if not answer_cache:
+        return {"enabled": False}
+    return {"enabled": True, **(await db_stage.run(answer_cache.stats))}
+
+@app.get("/debug/semantic-cache")
+async def debug_semantic_cache():
+    """Debug endpoint with semantic answer cache metrics and the cached questions per scope"""
+    if not semantic_cache:
+        return {"enabled": False}
+    return {"enabled": True, **semantic_cache.stats(), "questions": semantic_cache.entries()}
+
+@app.delete("/debug/semantic-cache")
+async def purge_semantic_cache(book_id: Optional[str] = None):
+    """Purge the semantic answer cache, or only the scopes that can include book_id"""
+    if not semantic_cache:
+        raise HTTPException(status_code=404, detail="Semantic cache is disabled")
+    return {"purged": semantic_cache.purge(book_id)}
+
+@app.get("/debug/text-store")
+async def debug_text_store():
+    """Debug endpoint with chunk content storage mode and text block cache metrics"""
+    return book_text_store.stats()
+
 @app.post("/generate-audio")
 async def generate_audio(request: dict):
     """Generate audio from text using Murf AI"""
@@ -463,17 +922,57 @@ async def generate_audio(request: dict):
     if not text:
         raise HTTPException(status_code=400, detail="Text is required")
     
-    if len(text) > 3000:
-        raise HTTPException(status_code=400, detail="Text too long (max 3000 characters)")
+    if len(text) > TTS_MAX_TEXT_CHARS:
+        raise HTTPException(status_code=400, detail=f"Text too long (max {TTS_MAX_TEXT_CHARS} characters)")
     
+    # Standalone TTS yields to the audio of interactive answers
+    upstream_priority.set(BULK)
     try:
-        result = murf_client.generate_audio(text, voice_id)
+        result = await murf_client.generate_audio(text, voice_id)
         return result
+    except UpstreamBusyError:
+        raise
     except Exception as e:
         print(f"Audio generation error: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating audio: {str(e)}")
 
 
+@app.post("/generate-audio/stream")
+async def generate_audio_stream(request: dict):
+    """
+    Generate audio segment by segment as newline-delimited JSON
+    Each segment is sent (in order) as soon as it is ready so playback can
+    start early; the last line has the joined file and the full playlist
+    """
+    if not murf_client:
+        raise HTTPException(status_code=500, detail="Murf client not available")
+    
+    text = request.get("text", "")
+    voice_id = request.get("voice_id", "en-US-ken")
+    
+    if not text:
+        raise HTTPException(status_code=400, detail="Text is required")
+    
+    if len(text) > TTS_MAX_TEXT_CHARS:
+        raise HTTPException(status_code=400, detail=f"Text too long (max {TTS_MAX_TEXT_CHARS} characters)")
+    
+    async def segment_lines():
+        upstream_priority.set(BULK)
+        segments = murf_client.prepare_segments(text)
+        results = []
+        try:
+            async for result in murf_client.iter_audio_segments(segments, voice_id):
+                results.append(result)
+                yield json.dumps({"type": "segment", **result}) + "\n"
+        except UpstreamBusyError as e:
+            yield json.dumps({"type": "error", "error": str(e), "retry_after": e.retry_after}) + "\n"
+            return
+        final = await murf_client.combine_segments(results, voice_id)
+        yield json.dumps({"type": "done", **final}) + "\n"
+    
+    return StreamingResponse(segment_lines(), media_type="application/x-ndjson")
+
+
 @app.get("/voices")
 async def get_available_voices():
     """Get available voices from Murf AI"""
@@ -524,16 +1023,13 @@ async def ask_question_with_audio(request: dict):
         )
         
         # Get AI response
-        query_embedding = embedding_service.generate_embedding(query)
-        
-        mongo_query = {"embedding": {"$exists": True}}
-        if book_ids:
-            mongo_query["book_id"] = {"$in": book_ids}
+        query_embedding = await embedding_batcher.embed(query)
+        index_version = vector_index.version(book_ids)
+        hit = semantic_answer(query_embedding, book_ids, target_language, index_version)
         
-        chunks_collection = database.get_chunks_collection()
-        chunks = list(chunks_collection.find(mongo_query))
-        
-        if not chunks:
+        if hit:
+            ai_response = {**hit["response"], "query": query, **semantic_hit_fields(hit)}
+        elif not await db_stage.run(vector_index.count, book_ids):
             ai_response = {
                 "success": False,
                 "answer": "No textbook content available to answer this question.",
@@ -543,42 +1039,43 @@ async def ask_question_with_audio(request: dict):
                 "language": target_language
             }
         else:
-            similar_chunks = embedding_service.find_similar_chunks(
-                query_embedding, chunks, 5
-            )
+            similar_chunks = await db_stage.run(retrieve_similar_chunks, query_embedding, book_ids, 5)
             
             filtered_chunks = [
                 chunk for chunk in similar_chunks 
                 if chunk['similarity_score'] >= 0.3
             ]
             
+            cache_key = answer_cache_key(query, book_ids, target_language, filtered_chunks)
+            cached = await cached_answer(cache_key)
+            
             if not filtered_chunks:
-                answer = gemini_client.generate_simple_response(query, target_language)
+                simple_response = cached or await gemini_client.generate_simple_response(query, target_language)
+                if not cached and simple_response["success"]:
+                    await remember_answer(cache_key, simple_response)
                 ai_response = {
-                    "success": True,
-                    "answer": f"Based on general knowledge: {answer}",
+                    "success": simple_response["success"],
+                    "answer": f"Based on general knowledge: {simple_response['answer']}" if simple_response["success"] else simple_response["answer"],
                     "query": query,
                     "sources": [],
                     "chunks_used": [],
                     "note": "No highly relevant textbook content found.",
-                    "language": target_language
+                    "language": target_language,
+                    "cached": cached is not None
                 }
             else:
-                books_collection = database.get_books_collection()
                 book_ids_found = list(set(chunk['book_id'] for chunk in filtered_chunks))
-                books = {}
-                
-                if book_ids_found:
-                    books_cursor = books_collection.find(
-                        {"_id": {"$in": [ObjectId(bid) for bid in book_ids_found]}}
-                    )
-                    books = {str(book['_id']): book['filename'] for book in books_cursor}
+                books = await db_stage.run(book_filenames_by_id, book_ids_found)
                 
                 book_filenames = [books.get(chunk['book_id'], 'Unknown') for chunk in filtered_chunks]
                 
-                gemini_response = gemini_client.generate_educational_response(
-                    query, filtered_chunks, book_filenames, target_language
-                )
+                gemini_response = cached
+                if gemini_response is None:
+                    gemini_response = await gemini_client.generate_educational_response(
+                        query, filtered_chunks, book_filenames, target_language
+                    )
+                    if gemini_response["success"]:
+                        await remember_answer(cache_key, gemini_response)
                 
                 source_chunks = []
                 for chunk in filtered_chunks:
@@ -599,14 +1096,22 @@ async def ask_question_with_audio(request: dict):
                     "chunks_used": source_chunks,
                     "total_chunks_found": len(filtered_chunks),
                     "language": gemini_response.get("language", "English"),
-                    "language_code": target_language
+                    "language_code": target_language,
+                    "prompt_tokens": gemini_response.get("prompt_tokens"),
+                    "cached": cached is not None
                 }
         
         # Generate audio if requested and Murf client is available
         audio_result = None
         if generate_audio_flag and murf_client and ai_response.get("success") and ai_response.get("answer"):
-            print("Generating audio in {target_language} for AI response...")
-            audio_result = murf_client.generate_audio(ai_response["answer"], voice_id)
+            audio_result = semantic_audio(hit["response"], voice_id) if hit else None
+            if audio_result is None:
+                print("Generating audio in {target_language} for AI response...")
+                try:
+                    audio_result = await murf_client.generate_audio(ai_response["answer"], voice_id)
+                except UpstreamBusyError as e:
+                    # The answer is still worth returning without its audio
+                    audio_result = {"success": False, "error": str(e), "audio_url": None, "retry_after": e.retry_after}
         
         # Combine response
         result = {
@@ -615,16 +1120,150 @@ async def ask_question_with_audio(request: dict):
             "voice_used": voice_id if audio_result else None
         }
         
+        if not hit and result["success"]:
+            remember_semantic_answer(query_embedding, book_ids, target_language, index_version, query, result)
         return result
         
+    except UpstreamBusyError:
+        raise
     except Exception as e:
         print(f"Ask with audio error: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+@app.post("/ask-with-audio/stream")
+async def ask_question_with_audio_stream(request: dict):
+    """
+    Ask a question and stream the answer with its audio as server-sent events
+    Gemini's output is split into sentence groups while it streams and each
+    group is synthesized right away, so speech starts before the answer is
+    finished. Events: 'sources', 'token' (answer text), 'audio' (segments in
+    playback order), then 'done' with the joined audio and timings, or 'error'
+    """
+    print(f"=== ASK WITH AUDIO STREAM CALLED ===")
+    
+    if not gemini_client:
+        raise HTTPException(status_code=500, detail="Gemini client not available")
+    if not voice_pipeline:
+        raise HTTPException(status_code=500, detail="Murf client not available")
+    
+    query = request.get("query", "")
+    book_ids = request.get("book_ids")
+    voice_id = request.get("voice_id", "en-US-ken")
+    
+    if not query:
+        raise HTTPException(status_code=400, detail="Query is required")
+    
+    target_language = murf_client.get_language_from_voice(voice_id)["code"]
+    print(f"Target language detected: {target_language}")
+    
+    started = time.perf_counter()
+    try:
+        search_query = SearchQuery(query=query, book_ids=book_ids, top_k=5, min_similarity=0.3)
+        query_embedding = await embedding_batcher.embed(query)
+        index_version = vector_index.version(book_ids)
+        hit = semantic_answer(query_embedding, book_ids, target_language, index_version)
+        context = None if hit else await retrieve_answer_context(search_query, query_embedding)
+    except Exception as e:
+        print(f"Ask with audio stream retrieval error: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+    retrieval_ms = round((time.perf_counter() - started) * 1000, 1)
+    
+    async def events():
+        if hit:
+            response = hit["response"]
+            sources = {
+                "sources": response["sources"],
+                "chunks_used": response["chunks_used"],
+                "total_chunks_found": response.get("total_chunks_found", 0)
+            }
+        elif context is None:
+            yield sse_event("sources", {"query": query, "sources": [], "chunks_used": [], "language_code": target_language})
+            yield sse_event("done", {"success": False, "answer": NO_CONTENT_ANSWER, "audio": None, "timing": {"retrieval_ms": retrieval_ms}})
+            return
+        else:
+            sources = {
+                "sources": list(set(context["book_filenames"])),
+                "chunks_used": context["sources"],
+                "total_chunks_found": len(context["chunks"])
+            }
+        yield sse_event("sources", {"query": query, **sources, "language_code": target_language})
+        
+        if hit:
+            # A question close in meaning was already answered, replay it (and its audio, if still on disk)
+            note = response.get("note")
+            prefix = ""
+            done_fields = semantic_hit_fields(hit)
+            audio = semantic_audio(response, voice_id)
+            if audio:
+                yield sse_event("token", {"text": response["answer"]})
+                yield sse_event("audio", {"index": 0, **audio})
+                yield sse_event("done", {
+                    "success": True,
+                    "note": note,
+                    "voice_used": voice_id,
+                    **done_fields,
+                    "answer": response["answer"],
+                    "audio": audio,
+                    "timing": {"retrieval_ms": retrieval_ms, "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+                })
+                return
+            answer = replay_answer(response["answer"])
+        else:
+            # Same fallback as /ask-with-audio: a general answer, flagged as such
+            note = None if context["chunks"] else "No highly relevant textbook content found."
+            prefix = "" if context["chunks"] else "Based on general knowledge: "
+            cache_key = answer_cache_key(query, book_ids, target_language, context["chunks"])
+            cached = await cached_answer(cache_key)
+            done_fields = {"cached": cached is not None}
+            prompt = None if cached else gemini_client.build_prompt(query, context["chunks"], context["book_filenames"], target_language)
+            if prompt:
+                done_fields["prompt_tokens"] = gemini_client.prompt_tokens(prompt)
+            
+            async def answer_chunks():
+                answer_parts = []
+                async for text in gemini_client.stream_response(prompt):
+                    answer_parts.append(text)
+                    yield text
+                if "".join(answer_parts).strip():
+                    await remember_answer(cache_key, {"success": True, "answer": "".join(answer_parts)})
+            
+            answer = replay_answer(cached["answer"]) if cached else answer_chunks()
+        
+        async for event, data in voice_pipeline.stream(answer, voice_id, prefix, started):
+            if event == "done":
+                # Blocked or empty generations are reported as failures and never cached
+                answered = bool(data["answer"][len(prefix):].strip())
+                data = {
+                    "success": answered,
+                    **({} if answered else {"error": "No answer was generated for this question"}),
+                    "note": note,
+                    "voice_used": voice_id,
+                    **done_fields,
+                    **data,
+                    "timing": {"retrieval_ms": retrieval_ms, **data["timing"]}
+                }
+                if answered and not hit:
+                    remember_semantic_answer(query_embedding, book_ids, target_language, index_version, query, {
+                        "success": True,
+                        "answer": data["answer"],
+                        "query": query,
+                        **sources,
+                        "note": note,
+                        "audio": data["audio"],
+                        "voice_used": voice_id if data["audio"] else None
+                    })
+            yield sse_event(event, data)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.delete("/books/{book_id}")
-async def delete_book(book_id: str):
+def delete_book(book_id: str):
     """Delete a book and all its associated chunks"""
     try:
         books_collection = database.get_books_collection()
@@ -641,6 +1280,13 @@ async def delete_book(book_id: str):
         # Delete the book
         books_result = books_collection.delete_one({"_id": ObjectId(book_id)})
         
+        # Drop its vectors from the resident index and its stored text
+        vector_index.remove_book(book_id)
+        book_text_store.delete(book_id)
+        raw_text_store.delete(book_id)
+        if semantic_cache:
+            semantic_cache.purge(book_id)
+        
         return {
             "success": True,
             "message": f"Successfully deleted book: {book['filename']}",
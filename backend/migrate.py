@@ -0,0 +1,95 @@
+"""
+Data migrations for existing MongoDB collections
+
+Usage:
+    python migrate.py embeddings [--dtype float16] [--batch-size 500]
+    python migrate.py book-text
+"""
+import argparse
+from pymongo import UpdateOne
+from database import database
+from services.embedding_codec import encode_embedding, decode_embedding, embedding_format, FORMAT_CODES
+from services.text_store import raw_text_store
+
+
+def migrate_embeddings(dtype: str, batch_size: int):
+    """Re-encode stored embeddings (legacy arrays or other packed formats) as packed binaries"""
+    chunks_collection = database.get_chunks_collection()
+    cursor = chunks_collection.find(
+        {"embedding": {"$exists": True}},
+        {"_id": 1, "embedding": 1}
+    ).batch_size(batch_size)
+
+    converted, skipped = 0, 0
+    operations = []
+
+    for chunk in cursor:
+        if embedding_format(chunk["embedding"]) == dtype:
+            skipped += 1
+            continue
+
+        operations.append(UpdateOne(
+            {"_id": chunk["_id"]},
+            {"$set": {"embedding": encode_embedding(decode_embedding(chunk["embedding"]), dtype)}}
+        ))
+
+        if len(operations) >= batch_size:
+            chunks_collection.bulk_write(operations, ordered=False)
+            converted += len(operations)
+            operations = []
+            print(f"Converted {converted} embeddings...")
+
+    if operations:
+        chunks_collection.bulk_write(operations, ordered=False)
+        converted += len(operations)
+
+    print(f"Embedding migration complete: {converted} converted to {dtype}, {skipped} already {dtype}")
+
+
+def migrate_book_text():
+    """Move raw_text out of book documents into the compressed raw text store"""
+    books_collection = database.get_books_collection()
+    book_ids = [book["_id"] for book in books_collection.find({"raw_text": {"$exists": True}}, {"_id": 1})]
+    print(f"Moving raw text of {len(book_ids)} books...")
+
+    for number, book_id in enumerate(book_ids, 1):
+        # One book at a time, each raw_text can be large
+        book = books_collection.find_one({"_id": book_id}, {"raw_text": 1})
+        if not book or "raw_text" not in book:
+            continue
+
+        # Replace any file left by an interrupted run
+        raw_text_store.delete(str(book_id))
+        writer = raw_text_store.open_writer(str(book_id))
+        writer.write(book["raw_text"])
+        writer.close()
+
+        books_collection.update_one(
+            {"_id": book_id},
+            {"$unset": {"raw_text": ""}, "$set": {"text_length": len(book["raw_text"])}}
+        )
+        print(f"Moved raw text of book {book_id} ({number}/{len(book_ids)})")
+
+    print(f"Book text migration complete: {len(book_ids)} books moved")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate stored textbook data")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    embeddings_parser = subparsers.add_parser("embeddings", help="Pack chunk embeddings as BSON binaries")
+    embeddings_parser.add_argument("--dtype", choices=list(FORMAT_CODES), default="float16")
+    embeddings_parser.add_argument("--batch-size", type=int, default=500)
+
+    subparsers.add_parser("book-text", help="Move raw_text out of book documents into GridFS")
+
+    args = parser.parse_args()
+
+    if args.command == "embeddings":
+        migrate_embeddings(args.dtype, args.batch_size)
+    elif args.command == "book-text":
+        migrate_book_text()
+
+
+if __name__ == "__main__":
+    main()
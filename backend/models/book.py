@@ -3,18 +3,22 @@ from typing import Optional
 from bson import ObjectId
 
 class Book:
-    def __init__(self, filename: str, total_pages: int, raw_text: str):
+    def __init__(self, filename: str, total_pages: int, text_length: int, content_hash: str = None):
         self.filename = filename
         self.upload_date = datetime.now()
         self.total_pages = total_pages
-        self.raw_text = raw_text
-        self.text_length = len(raw_text)
+        self.text_length = text_length  # The raw text itself is kept in the raw text store
+        self.content_hash = content_hash  # sha256 of the uploaded PDF bytes
+        self.aliases = []  # Other filenames the same PDF was uploaded as
     
     def to_dict(self):
-        return {
+        book_dict = {
             "filename": self.filename,
             "upload_date": self.upload_date,
             "total_pages": self.total_pages,
-            "raw_text": self.raw_text,
-            "text_length": self.text_length
-        }
\ No newline at end of file
+            "text_length": self.text_length,
+            "aliases": self.aliases
+        }
+        if self.content_hash:
+            book_dict["content_hash"] = self.content_hash
+        return book_dict
\ No newline at end of file
@@ -3,24 +3,33 @@ from typing import Optional
 from bson import ObjectId
 
 class Chunk:
-    def __init__(self, book_id: str, content: str, chunk_index: int, chapter: str = None, section: str = None):
+    def __init__(self, book_id: str, content: str, chunk_index: int, chapter: str = None, section: str = None,
+                 text_start: int = None, text_end: int = None):
         self.book_id = book_id
         self.content = content
         self.chunk_index = chunk_index
         self.chapter = chapter
         self.section = section
+        self.text_start = text_start  # Offsets into the book's cleaned text
+        self.text_end = text_end
         self.word_count = len(content.split())
         self.char_count = len(content)
         self.created_at = datetime.now()
     
-    def to_dict(self):
-        return {
+    def to_dict(self, inline_content: bool = True):
+        chunk_dict = {
             "book_id": self.book_id,
             "content": self.content,
             "chunk_index": self.chunk_index,
             "chapter": self.chapter,
             "section": self.section,
+            "text_start": self.text_start,
+            "text_end": self.text_end,
             "word_count": self.word_count,
             "char_count": self.char_count,
             "created_at": self.created_at
-        }
\ No newline at end of file
+        }
+        if not inline_content:
+            # Content is materialized from the book text store
+            del chunk_dict["content"]
+        return chunk_dict
\ No newline at end of file
@@ -6,6 +6,8 @@ class SearchQuery(BaseModel):
     book_ids: Optional[List[str]] = None  # If None, search all books
     top_k: int = 5  # Number of results to return
     min_similarity: float = 0.1  # Minimum similarity threshold
+    ef_search: Optional[int] = None  # HNSW recall/latency knob (None uses the server default)
+    nprobe: Optional[int] = None  # IVF recall/latency knob (None uses the server default)
 
 class SearchResult(BaseModel):
     chunk_id: str
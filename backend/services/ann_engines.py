@@ -0,0 +1,249 @@
+import numpy as np
+import os
+from typing import Optional
+
+try:
+    import hnswlib
+except ImportError:  # Optional dependency, only needed for the "hnsw" engine
+    hnswlib = None
+
+
+class FlatEngine:
+    """Exact brute-force search, every row is a candidate"""
+    name = "flat"
+    exact = True
+
+    def build(self, matrix: np.ndarray):
+        pass
+
+    def add(self, matrix: np.ndarray, start: int):
+        pass
+
+    def remove(self, keep: np.ndarray):
+        pass
+
+    def search(self, query: np.ndarray, k: int, ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> Optional[np.ndarray]:
+        """Returns candidate row positions, None means all rows"""
+        return None
+
+    def save(self, directory: str):
+        pass
+
+    def load(self, directory: str, size: int) -> bool:
+        return True
+
+
+class IVFFlatEngine:
+    name = "ivf"
+    exact = False
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8, kmeans_iterations: int = 15):
+        """
+        Inverted-file index with exact vectors (IVF-flat)
+        Rows are clustered around nlist spherical k-means centroids; a query
+        only scans the rows of its nprobe closest centroids
+        Args:
+            nlist: Number of clusters (None picks ~4*sqrt(N) at build time)
+            nprobe: Default number of clusters scanned per query
+            kmeans_iterations: Training iterations for the centroids
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.kmeans_iterations = kmeans_iterations
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self._order = None
+        self._offsets = None
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def build(self, matrix: np.ndarray):
+        n = matrix.shape[0]
+        nlist = self.nlist or int(4 * np.sqrt(n))
+        # Too few rows to be worth clustering, stay exact until the next build
+        if nlist < 2 or n < nlist * 39:
+            self.centroids = None
+            self.assignments = np.empty(0, dtype=np.int32)
+            self._order = None
+            return
+
+        self.centroids = self._train(matrix, nlist)
+        self.assignments = self._assign(matrix)
+        self._order = None
+        print(f"IVF index trained with {nlist} lists over {n} vectors")
+
+    def add(self, matrix: np.ndarray, start: int):
+        """Assign rows matrix[start:] to lists, training first once the corpus is large enough"""
+        if not self.trained:
+            self.build(matrix)
+            return
+        self.assignments = np.concatenate([self.assignments, self._assign(matrix[start:])])
+        self._order = None
+
+    def remove(self, keep: np.ndarray):
+        if not self.trained:
+            return
+        self.assignments = self.assignments[keep]
+        self._order = None
+
+    def search(self, query: np.ndarray, k: int, ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> Optional[np.ndarray]:
+        if not self.trained:
+            return None
+
+        if self._order is None:
+            # Group row positions by list so each probe is one contiguous slice
+            self._order = np.argsort(self.assignments, kind="stable")
+            self._offsets = np.searchsorted(self.assignments[self._order], np.arange(len(self.centroids) + 1))
+
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        return np.concatenate([self._order[self._offsets[c]:self._offsets[c + 1]] for c in probe])
+
+    def save(self, directory: str):
+        if not self.trained:
+            return
+        np.savez(os.path.join(directory, "ivf.npz"), centroids=self.centroids, assignments=self.assignments)
+
+    def load(self, directory: str, size: int) -> bool:
+        path = os.path.join(directory, "ivf.npz")
+        if not os.path.exists(path):
+            return False
+        data = np.load(path)
+        if data["assignments"].shape[0] != size:
+            return False
+        self.centroids = data["centroids"]
+        self.assignments = data["assignments"]
+        self._order = None
+        return True
+
+    def _train(self, matrix: np.ndarray, nlist: int) -> np.ndarray:
+        """Spherical k-means on a sample of at most 256 points per list"""
+        rng = np.random.default_rng(0)
+        sample_size = min(matrix.shape[0], nlist * 256)
+        sample = matrix[rng.choice(matrix.shape[0], sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty clusters from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+            norms[empty] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        return centroids
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        labels = [
+            np.argmax(vectors[start:start + batch_size] @ self.centroids.T, axis=1)
+            for start in range(0, vectors.shape[0], batch_size)
+        ]
+        return np.concatenate(labels).astype(np.int32) if labels else np.empty(0, dtype=np.int32)
+
+
+class HNSWEngine:
+    name = "hnsw"
+    exact = False
+
+    def __init__(self, dimension: int, m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        """
+        Hierarchical navigable small world graph backed by hnswlib
+        Graph labels are stable ids, mapped to current row positions so
+        removals only mark labels deleted instead of rebuilding the graph
+        Args:
+            dimension: Embedding dimension
+            m: Graph degree (memory vs recall)
+            ef_construction: Build-time candidate list size
+            ef_search: Default query-time candidate list size
+        """
+        if hnswlib is None:
+            raise Exception("hnswlib is not installed, cannot use the hnsw engine")
+        self.dimension = dimension
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+        self.label_to_row = np.empty(0, dtype=np.int64)
+
+    def build(self, matrix: np.ndarray):
+        n = matrix.shape[0]
+        self.index = hnswlib.Index(space="ip", dim=self.dimension)
+        self.index.init_index(max_elements=max(n, 1024), ef_construction=self.ef_construction, M=self.m)
+        self.label_to_row = np.arange(n, dtype=np.int64)
+        if n:
+            self.index.add_items(matrix, self.label_to_row)
+
+    def add(self, matrix: np.ndarray, start: int):
+        vectors = matrix[start:]
+        if not vectors.shape[0]:
+            return
+        labels = np.arange(len(self.label_to_row), len(self.label_to_row) + vectors.shape[0], dtype=np.int64)
+        needed = len(self.label_to_row) + vectors.shape[0]
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+        self.index.add_items(vectors, labels)
+        self.label_to_row = np.concatenate([self.label_to_row, np.arange(start, matrix.shape[0])])
+
+    def remove(self, keep: np.ndarray):
+        live = self.label_to_row >= 0
+        removed_labels = np.flatnonzero(live)[~keep[self.label_to_row[live]]]
+        for label in removed_labels:
+            self.index.mark_deleted(int(label))
+
+        # Shift surviving rows down to their compacted positions
+        new_rows = np.cumsum(keep) - 1
+        self.label_to_row[live] = np.where(keep[self.label_to_row[live]], new_rows[self.label_to_row[live]], -1)
+
+    def search(self, query: np.ndarray, k: int, ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> Optional[np.ndarray]:
+        live = int(np.count_nonzero(self.label_to_row >= 0))
+        if not live:
+            return np.empty(0, dtype=np.int64)
+        k = min(k, live)
+        self.index.set_ef(max(ef_search or self.ef_search, k))
+        labels, _ = self.index.knn_query(query.reshape(1, -1), k=k)
+        rows = self.label_to_row[labels[0].astype(np.int64)]
+        return rows[rows >= 0]
+
+    def save(self, directory: str):
+        self.index.save_index(os.path.join(directory, "hnsw.bin"))
+        np.save(os.path.join(directory, "hnsw_labels.npy"), self.label_to_row)
+
+    def load(self, directory: str, size: int) -> bool:
+        index_path = os.path.join(directory, "hnsw.bin")
+        labels_path = os.path.join(directory, "hnsw_labels.npy")
+        if not (os.path.exists(index_path) and os.path.exists(labels_path)):
+            return False
+        label_to_row = np.load(labels_path)
+        if int(np.count_nonzero(label_to_row >= 0)) != size:
+            return False
+        self.index = hnswlib.Index(space="ip", dim=self.dimension)
+        self.index.load_index(index_path, max_elements=max(len(label_to_row), 1024))
+        self.label_to_row = label_to_row
+        return True
+
+
+def create_engine(name: str, dimension: int):
+    """Create an ANN engine by name ("flat", "ivf" or "hnsw")"""
+    if name == "ivf":
+        return IVFFlatEngine(
+            nlist=int(os.getenv("IVF_NLIST", "0")) or None,
+            nprobe=int(os.getenv("IVF_NPROBE", "8"))
+        )
+    if name == "hnsw":
+        try:
+            return HNSWEngine(
+                dimension,
+                m=int(os.getenv("HNSW_M", "16")),
+                ef_construction=int(os.getenv("HNSW_EF_CONSTRUCTION", "200")),
+                ef_search=int(os.getenv("HNSW_EF_SEARCH", "64"))
+            )
+        except Exception as e:
+            print(f"Warning: {e}, falling back to flat search")
+    return FlatEngine()
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+
+class MemoryAnswerStore:
+    def __init__(self, max_entries: int):
+        """In-process LRU store; entries carry their own expiry time"""
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] < time.time():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry["value"]
+
+    def put(self, key: str, value: Dict[str, Any], ttl_seconds: float):
+        with self._lock:
+            self._entries[key] = {"value": value, "expires_at": time.time() + ttl_seconds}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            cleared = len(self._entries)
+            self._entries.clear()
+        return cleared
+
+    def count(self) -> int:
+        return len(self._entries)
+
+
+class MongoAnswerStore:
+    def __init__(self, collection):
+        """
+        MongoDB store shared by every API worker
+        A TTL index removes expired entries; hits push the expiry forward
+        """
+        self.collection = collection
+        self.evictions = 0  # Expiry is done by MongoDB
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.now()}})
+        if doc is None:
+            return None
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"expires_at": datetime.now() + timedelta(seconds=doc["ttl_seconds"])}}
+        )
+        return doc["value"]
+
+    def put(self, key: str, value: Dict[str, Any], ttl_seconds: float):
+        now = datetime.now()
+        self.collection.replace_one(
+            {"_id": key},
+            {"value": value, "ttl_seconds": ttl_seconds, "created_at": now, "expires_at": now + timedelta(seconds=ttl_seconds)},
+            upsert=True
+        )
+
+    def clear(self) -> int:
+        return self.collection.delete_many({}).deleted_count
+
+    def count(self) -> int:
+        return self.collection.estimated_document_count()
+
+
+class AnswerCache:
+    def __init__(self, store, ttl_seconds: float, model_name: str):
+        """
+        Cache of generated answers in front of Gemini
+        Keyed by the normalized question, the book scope, the answer language
+        and the ids of the retrieved chunks, so re-uploads and re-embedding
+        (which change the retrieved chunks) never serve a stale answer
+        Args:
+            store: MemoryAnswerStore or MongoAnswerStore
+            ttl_seconds: How long an answer is kept without being asked again
+            model_name: Gemini model, part of every key
+        """
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Case, spacing and trailing punctuation don't change the question"""
+        return " ".join(query.casefold().split()).rstrip("?!.। ")
+
+    def key(self, query: str, book_ids: Optional[List[str]], language: str, chunk_ids: List[Any]) -> str:
+        material = json.dumps([
+            self.model_name,
+            self.normalize_query(query),
+            sorted(book_ids) if book_ids else None,
+            language,
+            sorted(str(chunk_id) for chunk_id in chunk_ids)
+        ], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.store.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a successful answer (failures are never cached)"""
+        if not value.get("success"):
+            return
+        self.store.put(key, value, self.ttl_seconds)
+        self.stores += 1
+
+    def clear(self) -> int:
+        return self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.store).__name__,
+            "entries": self.store.count(),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "stores": self.stores,
+            "evictions": self.store.evictions
+        }
+
+
+def _answer_store():
+    backend = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+    if backend == "off":
+        return None
+    if backend == "mongo":
+        from database import database
+        return MongoAnswerStore(database.get_answer_cache_collection())
+    return MemoryAnswerStore(int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")))
+
+
+# Global answer cache (None when ANSWER_CACHE_BACKEND=off)
+try:
+    _store = _answer_store()
+except Exception as e:
+    print(f"Warning: Could not initialize answer cache: {e}")
+    _store = None
+
+answer_cache = AnswerCache(
+    _store,
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600))),
+    model_name=os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+) if _store else None
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import time
+from threading import Lock
+from typing import Dict, Any, Optional
+
+AUDIO_EXTENSION = ".mp3"
+
+
+class AudioCache:
+    def __init__(self, audio_dir: str, max_bytes: int, ttl_seconds: float):
+        """
+        Content-addressed cache of generated speech files
+        Files are named by a hash of (cleaned text, voice, format params), so a
+        repeated request is served from disk without calling the TTS API. Each
+        file's mtime records its last access, so the LRU order survives restarts
+        Args:
+            audio_dir: Directory the audio files are served from
+            max_bytes: Byte budget for the directory, least recently used files go first
+            ttl_seconds: Files not accessed for this long are removed (0 disables)
+        """
+        self.audio_dir = audio_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = Lock()
+        self._entries: Dict[str, Dict[str, float]] = {}  # filename -> size, last_access
+        self._total_bytes = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evicted_files = 0
+
+        os.makedirs(audio_dir, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def key(cleaned_text: str, voice_id: str, format_params: Dict[str, Any]) -> str:
+        material = json.dumps([cleaned_text, voice_id, format_params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def filename(self, key: str) -> str:
+        return f"tts_{key[:40]}{AUDIO_EXTENSION}"
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.audio_dir, filename)
+
+    def get(self, key: str) -> Optional[str]:
+        """Filename of the cached audio for key, or None"""
+        filename = self.filename(key)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is None or not os.path.exists(self.path(filename)):
+                if entry is not None:
+                    self._forget(filename)
+                self.misses += 1
+                return None
+            entry["last_access"] = time.time()
+            self.hits += 1
+
+        try:
+            os.utime(self.path(filename))  # Persist the access for LRU after restarts
+        except OSError:
+            pass
+        return filename
+
+    def add(self, filename: str):
+        """Register a file that was just written (atomically) into the directory"""
+        size = os.path.getsize(self.path(filename))
+        with self._lock:
+            self._forget(filename)
+            self._entries[filename] = {"size": size, "last_access": time.time()}
+            self._total_bytes += size
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove expired files, then least recently used ones until under the byte budget"""
+        now = time.time()
+        with self._lock:
+            by_age = sorted(self._entries.items(), key=lambda item: item[1]["last_access"])
+            doomed = []
+            for filename, entry in by_age:
+                expired = self.ttl_seconds and now - entry["last_access"] > self.ttl_seconds
+                if not expired and self._total_bytes <= self.max_bytes:
+                    break
+                doomed.append(filename)
+                self._forget(filename)
+            self.evicted_files += len(doomed)
+
+        for filename in doomed:
+            try:
+                os.remove(self.path(filename))
+            except FileNotFoundError:
+                pass
+        if doomed:
+            print(f"Audio cache evicted {len(doomed)} files, {self._total_bytes} bytes in use")
+        return len(doomed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "files": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted_files": self.evicted_files
+        }
+
+    def _scan(self):
+        """Index the audio already on disk (including files from before the cache)"""
+        for entry in os.scandir(self.audio_dir):
+            if entry.is_file() and entry.name.endswith(AUDIO_EXTENSION):
+                stat = entry.stat()
+                self._entries[entry.name] = {"size": stat.st_size, "last_access": stat.st_mtime}
+                self._total_bytes += stat.st_size
+
+    def _forget(self, filename: str):
+        entry = self._entries.pop(filename, None)
+        if entry:
+            self._total_bytes -= entry["size"]
+
+
+# Global audio cache
+audio_cache = AudioCache(
+    "audio_files",
+    max_bytes=int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(500 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("AUDIO_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+)
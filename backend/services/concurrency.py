@@ -0,0 +1,273 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class BlockingStage:
+    def __init__(self, name: str, max_workers: int):
+        """
+        Runs one stage's blocking calls (pymongo, PDF parsing, sync HTTP) on its
+        own bounded thread pool, so they never block the event loop and a slow
+        stage can only exhaust its own threads
+        Args:
+            name: Stage name used for thread names and metrics
+            max_workers: Threads (and so concurrent calls) for this stage
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-stage")
+
+        # Metrics
+        self.pending = 0  # Queued or running
+        self.max_pending = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        try:
+            result = await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+            self.completed += 1
+            return result
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+
+# Priority classes for upstream calls, lower goes first
+INTERACTIVE = 0  # A user is waiting on the answer (/ask and friends)
+BULK = 1  # Long or batch work that can wait (e.g. /generate-audio)
+
+# Priority of upstream calls made by the current request
+upstream_priority: ContextVar[int] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+class UpstreamBusyError(Exception):
+    def __init__(self, stage: str, retry_after: int, reason: str):
+        """Raised when a stage can't take a call soon enough; becomes a 503 with Retry-After"""
+        super().__init__(f"{stage} is busy ({reason}), retry after {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class AsyncStage:
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        rate_per_second: float = 0,
+        burst: int = 1,
+        max_queue: int = 0,
+        queue_timeout: float = 0
+    ):
+        """
+        Schedules the awaitable calls of one stage (e.g. an upstream API)
+        At most max_concurrency calls run at once and, with a rate, calls start
+        no faster than a token bucket allows. Waiting calls are served by
+        priority class (see upstream_priority), then in arrival order; a full
+        queue or a wait past the timeout raises UpstreamBusyError
+        Args:
+            name: Stage name used for metrics
+            max_concurrency: Calls allowed in flight, the rest wait their turn
+            rate_per_second: Calls started per second (0 disables the rate limit)
+            burst: Calls that may start at once after an idle period
+            max_queue: Waiting calls allowed per priority class (0 for unbounded)
+            queue_timeout: Longest wait for a slot in seconds (0 waits forever)
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate_per_second = rate_per_second
+        self.burst = max(burst, 1)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # Heap of (priority, arrival, future)
+        self._queued: Dict[int, int] = {}  # priority -> waiting calls
+        self._arrivals = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+        # Metrics
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def run(self, coroutine_fn: Callable, *args, **kwargs) -> Any:
+        async with self.limit():
+            return await coroutine_fn(*args, **kwargs)
+
+    @asynccontextmanager
+    async def limit(self) -> AsyncIterator[None]:
+        """Hold one of the stage's slots, e.g. for the length of a streamed response"""
+        await self._acquire(upstream_priority.get())
+        try:
+            yield
+            self.completed += 1
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+            self._dispatch()
+
+    async def _acquire(self, priority: int):
+        if self.max_queue and self._queued.get(priority, 0) >= self.max_queue:
+            self.rejected += 1
+            raise UpstreamBusyError(self.name, self._retry_after(), "queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        self._dispatch()
+        if future.done():
+            return  # A slot was free
+
+        self._queued[priority] = self._queued.get(priority, 0) + 1
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self.timed_out += 1
+                raise UpstreamBusyError(self.name, self._retry_after(), "queue timeout")
+        except BaseException:
+            if not future.cancel():
+                self.active -= 1  # Granted a slot just as the caller gave up
+                self._dispatch()
+            raise
+        finally:
+            self.waiting -= 1
+            self._queued[priority] -= 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting calls, highest priority first"""
+        while self._waiters and self.active < self.max_concurrency:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)  # Timed out or cancelled
+                continue
+            if not self._take_token():
+                if self._wakeup is None:
+                    delay = (1 - self._tokens) / self.rate_per_second
+                    self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+                return
+            _, _, future = heapq.heappop(self._waiters)
+            self.active += 1
+            future.set_result(None)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def _take_token(self) -> bool:
+        if not self.rate_per_second:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_second)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _retry_after(self) -> int:
+        """Seconds until the queued calls have likely started"""
+        per_second = self.rate_per_second or self.max_concurrency
+        return max(1, math.ceil(self.waiting / per_second))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rate_per_second": self.rate_per_second,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "waiting_by_priority": {"interactive": self._queued.get(INTERACTIVE, 0), "bulk": self._queued.get(BULK, 0)},
+            "active": self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out
+        }
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        """
+        Coalesces identical concurrent calls: while a call for a key is in
+        flight, later callers with the same key await it and share its result
+        (or its exception) instead of starting their own
+        Args:
+            name: Name used for metrics
+        """
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+        # Metrics
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, coroutine_fn: Callable, *args, **kwargs) -> Any:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            # A task of its own, so a caller that gives up doesn't cancel it for the others
+            task = asyncio.ensure_future(coroutine_fn(*args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight)
+        }
+
+
+# Global request path stages
+db_stage = BlockingStage("db", int(os.getenv("DB_STAGE_THREADS", "16")))
+ingest_stage = BlockingStage("ingest", int(os.getenv("INGEST_STAGE_THREADS", "2")))
+gemini_stage = AsyncStage(
+    "gemini",
+    int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+    rate_per_second=float(os.getenv("GEMINI_RATE_PER_SECOND", "10")),
+    burst=int(os.getenv("GEMINI_RATE_BURST", "20")),
+    max_queue=int(os.getenv("GEMINI_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("GEMINI_QUEUE_TIMEOUT_SECONDS", "15"))
+)
+murf_stage = AsyncStage(
+    "murf",
+    int(os.getenv("MURF_MAX_CONCURRENCY", "4")),
+    rate_per_second=float(os.getenv("MURF_RATE_PER_SECOND", "5")),
+    burst=int(os.getenv("MURF_RATE_BURST", "10")),
+    max_queue=int(os.getenv("MURF_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("MURF_QUEUE_TIMEOUT_SECONDS", "15"))
+)
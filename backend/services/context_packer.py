@@ -0,0 +1,140 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Rough size of a token in characters, close enough for budgeting prompts
+CHARS_PER_TOKEN = 4
+# Shortest prefix/suffix match accepted as chunk overlap when offsets are missing
+MIN_OVERLAP_CHARS = 20
+WORD = re.compile(r'\w+')
+
+
+class ContextPacker:
+    def __init__(self, token_budget: int, duplicate_threshold: float = 0.8, shingle_size: int = 5, max_overlap_chars: int = 200):
+        """
+        Packs retrieved chunks into the context of a prompt
+        Adjacent chunks of one book are merged with their overlap trimmed,
+        near-duplicate passages are dropped, and passages are added in
+        similarity order until the token budget is used up
+        Args:
+            token_budget: Estimated tokens the context may take
+            duplicate_threshold: Shingle Jaccard similarity above which a passage is a duplicate
+            shingle_size: Words per shingle
+            max_overlap_chars: Longest overlap searched for between chunks without offsets
+        """
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.shingle_size = shingle_size
+        self.max_overlap_chars = max_overlap_chars
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def pack(self, chunks: List[Dict[str, Any]], book_filenames: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Returns: The passages to send, best first, and packing counts
+        """
+        passages = self._merge_adjacent(chunks, book_filenames)
+        passages.sort(key=lambda passage: passage["similarity_score"], reverse=True)
+
+        packed, packed_shingles = [], []
+        duplicates = over_budget = 0
+        tokens_left = self.token_budget
+        for passage in passages:
+            shingles = self._shingles(passage["content"])
+            if any(self._jaccard(shingles, other) >= self.duplicate_threshold for other in packed_shingles):
+                duplicates += 1
+                continue
+
+            tokens = self.estimate_tokens(passage["content"])
+            if tokens > tokens_left:
+                if packed:
+                    over_budget += 1
+                    continue
+                # The best passage alone is over budget, send what fits of it
+                passage["content"] = passage["content"][:tokens_left * CHARS_PER_TOKEN]
+                tokens = tokens_left
+            packed.append(passage)
+            packed_shingles.append(shingles)
+            tokens_left -= tokens
+
+        return packed, {
+            "chunks": len(chunks),
+            "passages": len(packed),
+            "merged": len(chunks) - len(passages),
+            "duplicates_dropped": duplicates,
+            "over_budget_dropped": over_budget,
+            "context_tokens": self.token_budget - tokens_left
+        }
+
+    def _merge_adjacent(self, chunks: List[Dict[str, Any]], book_filenames: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """Join runs of consecutive chunk_index within each book into single passages"""
+        ordered = sorted(
+            (
+                (chunk, book_filenames[i] if book_filenames and i < len(book_filenames) else None)
+                for i, chunk in enumerate(chunks)
+            ),
+            key=lambda item: (str(item[0].get("book_id")), item[0].get("chunk_index", -1))
+        )
+
+        passages: List[Dict[str, Any]] = []
+        for chunk, book_filename in ordered:
+            last = passages[-1] if passages else None
+            if (
+                last is not None
+                and last["book_id"] == chunk.get("book_id")
+                and chunk.get("chunk_index") is not None
+                and chunk["chunk_index"] == last["chunk_index"] + 1
+            ):
+                last["content"] += self._continuation(last, chunk)
+                last["chunk_index"] = chunk["chunk_index"]
+                last["text_end"] = chunk.get("text_end")
+                last["similarity_score"] = max(last["similarity_score"], chunk.get("similarity_score", 0))
+                continue
+
+            passages.append({
+                "book_id": chunk.get("book_id"),
+                "book_filename": book_filename,
+                "chapter": chunk.get("chapter"),
+                "chunk_index": chunk.get("chunk_index"),
+                "text_end": chunk.get("text_end"),
+                "content": chunk["content"],
+                "similarity_score": chunk.get("similarity_score", 0)
+            })
+        return passages
+
+    def _continuation(self, passage: Dict[str, Any], chunk: Dict[str, Any]) -> str:
+        """The part of chunk that follows passage, without the text they share"""
+        content = chunk["content"]
+        if passage["text_end"] is not None and chunk.get("text_start") is not None:
+            shared = passage["text_end"] - chunk["text_start"]
+            if shared <= 0:
+                return "\n" + content  # Windows that were skipped or cut short leave a gap
+            return content[shared:]
+
+        # Older chunks without offsets: find the longest suffix that starts the next chunk
+        previous = passage["content"]
+        for length in range(min(self.max_overlap_chars, len(previous), len(content)), MIN_OVERLAP_CHARS - 1, -1):
+            if previous.endswith(content[:length]):
+                return content[length:]
+        return "\n" + content
+
+    def _shingles(self, text: str) -> Set[Tuple[str, ...]]:
+        words = WORD.findall(text.casefold())
+        if len(words) <= self.shingle_size:
+            return {tuple(words)}
+        return {tuple(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    @staticmethod
+    def _jaccard(a: Set[Tuple[str, ...]], b: Set[Tuple[str, ...]]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+
+# Global context packer
+context_packer = ContextPacker(
+    token_budget=int(os.getenv("GEMINI_CONTEXT_TOKEN_BUDGET", "3000")),
+    duplicate_threshold=float(os.getenv("GEMINI_CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+)
@@ -0,0 +1,116 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple
+from services.embeddings import embedding_service, EmbeddingService
+
+
+class EmbeddingBatcher:
+    def __init__(self, service: EmbeddingService, window_ms: float = 3.0, max_batch_size: int = 32):
+        """
+        Coalesce concurrent query-encode requests into one model.encode call
+        Requests wait up to window_ms (or until max_batch_size are queued),
+        while a batch is encoding new requests keep accumulating for the next one
+        Args:
+            service: Embedding service used for the batched encode
+            window_ms: How long the first request of a batch waits for company
+            max_batch_size: Largest batch sent to the model at once
+        """
+        self.service = service
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._flush_handle = None
+        self._encoding = False
+        # One encode thread: the model already uses every core for a batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-batcher")
+
+        # Metrics
+        self.requests = 0
+        self.batches = 0
+        self.requests_encoded = 0
+        self.max_batch_seen = 0
+        self.total_wait_seconds = 0.0
+        self.total_encode_seconds = 0.0
+
+    async def embed(self, text: str) -> List[float]:
+        """Encode a single query, sharing the forward pass with concurrent callers"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        """Batching metrics for monitoring"""
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests_encoded / self.batches, 2) if self.batches else 0,
+            "max_batch_seen": self.max_batch_seen,
+            "pending": len(self._pending),
+            "avg_wait_ms": round(self.total_wait_seconds / self.requests_encoded * 1000, 3) if self.batches else 0,
+            "avg_encode_ms": round(self.total_encode_seconds / self.batches * 1000, 3) if self.batches else 0
+        }
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        # The running batch flushes again when it finishes, picking these up
+        if self._encoding or not self._pending:
+            return
+
+        batch = self._pending[:self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size:]
+        self._encoding = True
+        asyncio.get_running_loop().create_task(self._encode_batch(batch))
+
+    async def _encode_batch(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        loop = asyncio.get_running_loop()
+        texts = [text for text, _, _ in batch]
+        started = time.perf_counter()
+
+        try:
+            embeddings = await loop.run_in_executor(
+                self._executor,
+                functools.partial(self.service.generate_embeddings_batch, texts, show_progress_bar=False, use_cache=False)
+            )
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future, _), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+        finally:
+            finished = time.perf_counter()
+            self.batches += 1
+            self.requests_encoded += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.total_encode_seconds += finished - started
+            self.total_wait_seconds += sum(started - queued_at for _, _, queued_at in batch)
+            self._encoding = False
+
+            if self._pending:
+                self._flush()
+
+
+# Global batcher for query embeddings
+embedding_batcher = EmbeddingBatcher(
+    embedding_service,
+    window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "3")),
+    max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32"))
+)
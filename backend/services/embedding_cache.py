@@ -0,0 +1,61 @@
+import hashlib
+import numpy as np
+from datetime import datetime
+from pymongo import UpdateOne
+from typing import List, Dict
+from services.embedding_codec import encode_embedding, decode_embedding
+
+
+class EmbeddingCache:
+    def __init__(self, collection, model_key: str, ttl_seconds: int = 30 * 24 * 3600):
+        """
+        Content-addressed embedding cache stored in MongoDB
+        Keyed by (model, sha256 of the cleaned text), so identical passages
+        from re-uploads, new editions or overlapping extracts are encoded once
+        Args:
+            collection: MongoDB collection holding cached embeddings
+            model_key: Identifies the model/backend that produced the vectors
+            ttl_seconds: Entries are removed by MongoDB this long after they were written
+        """
+        self.collection = collection
+        self.model_key = model_key
+        self.hits = 0
+        self.misses = 0
+        try:
+            self.collection.create_index("created_at", expireAfterSeconds=ttl_seconds)
+        except Exception as e:
+            print(f"Warning: Could not create embedding cache TTL index: {e}")
+
+    def key(self, cleaned_text: str) -> str:
+        digest = hashlib.sha256(cleaned_text.encode("utf-8")).hexdigest()
+        return f"{self.model_key}:{digest}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look up cached embeddings, returns only the keys that were found"""
+        found = {
+            doc["_id"]: decode_embedding(doc["embedding"])
+            for doc in self.collection.find({"_id": {"$in": list(set(keys))}}, {"embedding": 1})
+        }
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, embeddings: Dict[str, List[float]]):
+        if not embeddings:
+            return
+        now = datetime.now()
+        self.collection.bulk_write(
+            [
+                # Stored at full precision so cached and fresh vectors are identical
+                UpdateOne(
+                    {"_id": key},
+                    {"$setOnInsert": {"embedding": encode_embedding(embedding, "float32"), "created_at": now}},
+                    upsert=True
+                )
+                for key, embedding in embeddings.items()
+            ],
+            ordered=False
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": self.collection.estimated_document_count()}
@@ -0,0 +1,67 @@
+import numpy as np
+import os
+import struct
+from bson.binary import Binary
+from typing import List, Any, Union
+
+# BSON binary subtype for packed embeddings (128+ is user defined)
+EMBEDDING_SUBTYPE = 0x80
+
+# One header byte identifies the storage format of the packed vector
+FORMAT_CODES = {"float32": 0, "float16": 1, "int8": 2}
+FORMAT_NAMES = {code: name for name, code in FORMAT_CODES.items()}
+
+DEFAULT_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float16")
+
+
+def encode_embedding(vector: Union[List[float], np.ndarray], dtype: str = DEFAULT_STORAGE_DTYPE) -> Binary:
+    """
+    Pack an embedding into a compact BSON Binary
+    Layout: 1 format byte, then for int8 a float32 scale, then the raw
+    little-endian values (384 dims: 1.5KB float32, 768B float16, 389B int8)
+    Args:
+        vector: Embedding vector
+        dtype: "float32", "float16" or "int8" (scalar quantized, per-vector scale)
+    Returns: Binary suitable for the chunk's 'embedding' field
+    """
+    if dtype not in FORMAT_CODES:
+        raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+
+    values = np.asarray(vector, dtype=np.float32)
+    header = bytes([FORMAT_CODES[dtype]])
+
+    if dtype == "int8":
+        max_abs = float(np.max(np.abs(values))) if values.size else 0.0
+        scale = max_abs / 127.0 if max_abs > 0 else 1.0
+        quantized = np.clip(np.rint(values / scale), -127, 127).astype(np.int8)
+        payload = header + struct.pack("<f", scale) + quantized.tobytes()
+    else:
+        payload = header + values.astype("<" + ("f4" if dtype == "float32" else "f2")).tobytes()
+
+    return Binary(payload, EMBEDDING_SUBTYPE)
+
+
+def decode_embedding(value: Any) -> np.ndarray:
+    """
+    Decode a stored embedding into a float32 vector
+    Packed binaries are read with np.frombuffer (no per-element Python
+    objects); legacy BSON arrays of doubles are still accepted
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        buffer = memoryview(value)
+        dtype = FORMAT_NAMES[buffer[0]]
+        if dtype == "float32":
+            return np.frombuffer(buffer, dtype="<f4", offset=1)
+        if dtype == "float16":
+            return np.frombuffer(buffer, dtype="<f2", offset=1).astype(np.float32)
+        scale = struct.unpack_from("<f", buffer, 1)[0]
+        return np.frombuffer(buffer, dtype=np.int8, offset=5).astype(np.float32) * np.float32(scale)
+
+    return np.asarray(value, dtype=np.float32)
+
+
+def embedding_format(value: Any) -> str:
+    """Storage format of a stored embedding ("list" for legacy arrays)"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return FORMAT_NAMES[memoryview(value)[0]]
+    return "list"
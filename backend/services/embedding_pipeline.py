@@ -0,0 +1,105 @@
+import os
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from typing import Callable, List, Any, Optional
+from database import database
+from services.embeddings import embedding_service
+from services.embedding_codec import encode_embedding
+from services.text_store import book_text_store
+
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBEDDING_WRITE_BATCH_SIZE", "256"))
+
+
+def generate_embeddings_for_book(
+    book_id: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    on_batch: Optional[Callable[[List[Any], List[str], List[List[float]]], None]] = None
+) -> int:
+    """
+    Embed a book's unembedded chunks in fixed-size batches
+    Each batch is encoded and written back with one unordered bulk_write,
+    so a crash only loses the batch in flight: chunks that already have an
+    embedding are skipped on the next run, which resumes where this one stopped
+    Args:
+        book_id: Book whose chunks should be embedded
+        batch_size: Chunks per encode call and per bulk_write
+        on_batch: Called with (chunk_ids, book_ids, embeddings) after each batch is written
+    Returns: Number of chunks embedded by this run
+    """
+    chunks_collection = database.get_chunks_collection()
+    books_collection = database.get_books_collection()
+
+    pending_filter = {"book_id": book_id, "embedding": {"$exists": False}}
+    remaining = chunks_collection.count_documents(pending_filter)
+    if not remaining:
+        print(f"No chunks need embeddings for book {book_id}")
+        return 0
+
+    total = chunks_collection.count_documents({"book_id": book_id})
+    embedded = total - remaining
+    print(f"Generating embeddings for {remaining} chunks of book {book_id} ({embedded}/{total} already done)...")
+    _record_progress(books_collection, book_id, "in_progress", embedded, total)
+
+    processed = 0
+    last_chunk_index = -1
+
+    try:
+        while True:
+            # Page by chunk_index instead of holding one cursor open across slow encodes
+            batch = list(
+                chunks_collection.find(
+                    {**pending_filter, "chunk_index": {"$gt": last_chunk_index}},
+                    {"_id": 1, "book_id": 1, "content": 1, "text_start": 1, "text_end": 1, "chunk_index": 1}
+                ).sort("chunk_index", 1).limit(batch_size)
+            )
+            if not batch:
+                break
+            book_text_store.materialize(batch)
+
+            embeddings = embedding_service.generate_embeddings_batch(
+                [chunk["content"] for chunk in batch], show_progress_bar=False
+            )
+
+            embedded_at = datetime.now()
+            chunks_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": chunk["_id"]},
+                        {"$set": {"embedding": encode_embedding(embedding), "embedded_at": embedded_at}}
+                    )
+                    for chunk, embedding in zip(batch, embeddings)
+                ],
+                ordered=False
+            )
+
+            processed += len(batch)
+            embedded += len(batch)
+            last_chunk_index = batch[-1]["chunk_index"]
+            _record_progress(books_collection, book_id, "in_progress", embedded, total, last_chunk_index)
+
+            if on_batch:
+                on_batch([chunk["_id"] for chunk in batch], [chunk["book_id"] for chunk in batch], embeddings)
+
+            print(f"Embedded {embedded}/{total} chunks of book {book_id}")
+    except Exception:
+        _record_progress(books_collection, book_id, "failed", embedded, total, last_chunk_index)
+        raise
+
+    _record_progress(books_collection, book_id, "completed", embedded, total, last_chunk_index)
+    print(f"Successfully generated embeddings for {processed} chunks")
+    return processed
+
+
+def _record_progress(books_collection, book_id: str, status: str, embedded: int, total: int, last_chunk_index: int = None):
+    """Store embedding progress on the book document for status endpoints"""
+    books_collection.update_one(
+        {"_id": ObjectId(book_id)},
+        {"$set": {"embedding_progress": {
+            "status": status,
+            "embedded_chunks": embedded,
+            "total_chunks": total,
+            "last_chunk_index": last_chunk_index,
+            "updated_at": datetime.now()
+        }}}
+    )
@@ -1,24 +1,44 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
 from typing import List, Dict, Any
 from sklearn.metrics.pairwise import cosine_similarity
 import os
+from services.embedding_codec import decode_embedding
+from services.embedding_cache import EmbeddingCache
 
 class EmbeddingService:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", backend: str = "torch", onnx_model_dir: str = None, onnx_model_file: str = "model_quantized.onnx", cache_collection=None):
         """
         Initialize the embedding service
         Using all-MiniLM-L6-v2: fast, good quality, only 80MB
+        Args:
+            model_name: SentenceTransformer model name
+            backend: "torch" (SentenceTransformer) or "onnx" (onnxruntime, CPU)
+            onnx_model_dir: Directory produced by export_onnx.py (onnx backend only)
+            onnx_model_file: model.onnx or the int8 model_quantized.onnx
+            cache_collection: MongoDB collection for the content-hash embedding cache (None disables it)
         """
         self.model_name = model_name
+        self.backend = backend
+        self.onnx_model_dir = onnx_model_dir or os.path.join("onnx_models", model_name)
+        self.onnx_model_file = onnx_model_file
         self.model = None
+        model_key = f"{model_name}:{backend}" + (f":{onnx_model_file}" if backend == "onnx" else "")
+        self.cache = EmbeddingCache(
+            cache_collection, model_key, int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+        ) if cache_collection is not None else None
         self._load_model()
     
     def _load_model(self):
         """Load the sentence transformer model"""
         try:
-            print(f"Loading embedding model: {self.model_name}")
-            self.model = SentenceTransformer(self.model_name)
+            print(f"Loading embedding model: {self.model_name} ({self.backend} backend)")
+            if self.backend == "onnx":
+                from services.onnx_encoder import OnnxSentenceEncoder
+                self.model = OnnxSentenceEncoder(self.onnx_model_dir, self.onnx_model_file)
+            else:
+                # Imported lazily so the onnx backend never pays for importing torch
+                from sentence_transformers import SentenceTransformer
+                self.model = SentenceTransformer(self.model_name)
             print("Embedding model loaded successfully")
         except Exception as e:
             print(f"Error loading model: {e}")
@@ -41,9 +61,13 @@ class EmbeddingService:
         # Convert to list for MongoDB storage
         return embedding.tolist()
     
-    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    def generate_embeddings_batch(self, texts: List[str], show_progress_bar: bool = True, use_cache: bool = True) -> List[List[float]]:
         """
         Generate embeddings for multiple texts at once (more efficient)
+        Args:
+            texts: Texts to encode
+            show_progress_bar: Show the encoder's progress bar
+            use_cache: Go through the content-hash cache (meant for ingestion, not live queries)
         Returns: List of embedding vectors
         """
         if not self.model:
@@ -52,18 +76,33 @@ class EmbeddingService:
         # Clean texts
         cleaned_texts = [self._clean_text_for_embedding(text) for text in texts]
         
-        # Generate embeddings in batch
-        embeddings = self.model.encode(cleaned_texts, convert_to_tensor=False, show_progress_bar=True)
+        if not self.cache or not use_cache:
+            # Generate embeddings in batch
+            embeddings = self.model.encode(cleaned_texts, convert_to_tensor=False, show_progress_bar=show_progress_bar)
+            
+            # Convert to list of lists
+            return [embedding.tolist() for embedding in embeddings]
+        
+        # Only send texts the cache hasn't seen (each distinct text once) to the model
+        keys = [self.cache.key(text) for text in cleaned_texts]
+        cached = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, cleaned_texts) if key not in cached}
+        
+        if missing:
+            encoded = self.model.encode(list(missing.values()), convert_to_tensor=False, show_progress_bar=show_progress_bar)
+            fresh = {key: embedding.tolist() for key, embedding in zip(missing, encoded)}
+            self.cache.put_many(fresh)
+        else:
+            fresh = {}
         
-        # Convert to list of lists
-        return [embedding.tolist() for embedding in embeddings]
+        return [fresh[key] if key in fresh else cached[key].tolist() for key in keys]
     
     def find_similar_chunks(self, query_embedding: List[float], chunk_embeddings: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
         """
         Find most similar chunks to query
         Args:
             query_embedding: Query embedding vector
-            chunk_embeddings: List of dicts with 'embedding' and other chunk data
+            chunk_embeddings: List of dicts with 'embedding' (packed or list) and other chunk data
             top_k: Number of top results to return
         Returns: Ranked list of chunks with similarity scores
         """
@@ -71,7 +110,7 @@ class EmbeddingService:
             return []
         
         # Extract embeddings and prepare data
-        embeddings_matrix = np.array([chunk['embedding'] for chunk in chunk_embeddings])
+        embeddings_matrix = np.stack([decode_embedding(chunk['embedding']) for chunk in chunk_embeddings])
         query_vector = np.array([query_embedding])
         
         # Calculate cosine similarities
@@ -81,10 +120,14 @@ class EmbeddingService:
         for i, chunk in enumerate(chunk_embeddings):
             chunk['similarity_score'] = float(similarities[i])
         
-        # Sort by similarity score (descending) and return top_k
-        sorted_chunks = sorted(chunk_embeddings, key=lambda x: x['similarity_score'], reverse=True)
+        # Partially select the top_k instead of sorting every chunk
+        k = min(top_k, len(chunk_embeddings))
+        if k <= 0:
+            return []
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top], kind="stable")]
         
-        return sorted_chunks[:top_k]
+        return [chunk_embeddings[i] for i in top]
     
     def _clean_text_for_embedding(self, text: str) -> str:
         """Clean text to improve embedding quality"""
@@ -102,5 +145,17 @@ class EmbeddingService:
         
         return text.strip()
 
+def _embedding_cache_collection():
+    if os.getenv("EMBEDDING_CACHE", "mongo") != "mongo":
+        return None
+    from database import database
+    return database.get_embedding_cache_collection()
+
+
 # Global embedding service instance
-embedding_service = EmbeddingService()
\ No newline at end of file
+embedding_service = EmbeddingService(
+    backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+    onnx_model_dir=os.getenv("ONNX_MODEL_DIR"),
+    onnx_model_file=os.getenv("ONNX_MODEL_FILE", "model_quantized.onnx"),
+    cache_collection=_embedding_cache_collection()
+)
\ No newline at end of file
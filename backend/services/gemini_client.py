@@ -1,7 +1,9 @@
 import google.generativeai as genai
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator
 from dotenv import load_dotenv
+from services.concurrency import SingleFlight, UpstreamBusyError, gemini_stage
+from services.context_packer import context_packer
 
 load_dotenv()
 
@@ -15,7 +17,14 @@ class GeminiClient:
         genai.configure(api_key=self.api_key)
         
         # Initialize the model
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+        self.model = genai.GenerativeModel(self.model_name)
+        
+        # Identical prompts sent at the same time share one Gemini call
+        self.single_flight = SingleFlight("gemini")
+        
+        # Retrieved chunks are merged, deduplicated and fitted to a token budget
+        self.context_packer = context_packer
 
         # Language mappings for prompts
         self.language_prompts = {
@@ -108,12 +117,9 @@ Educational Response ({lang_info['name']}):"""
         
         return prompt
     
-    def generate_simple_response(self, query: str, target_language: str = "en-US") -> str:
-        """Generate a simple response without context in specified language"""
-        try:
-            lang_info = self.language_prompts.get(target_language, self.language_prompts["en-US"])
-            
-            prompt = f"""IMPORTANT: {lang_info['instruction']}
+    def _create_simple_prompt(self, query: str, lang_info: Dict[str, str]) -> str:
+        """Create a prompt for a general answer without textbook context"""
+        return f"""IMPORTANT: {lang_info['instruction']}
 
 Provide a brief, educational explanation for: {query}
 
@@ -124,19 +130,67 @@ Requirements:
 - {lang_info['educational_note']}
 
 Response in {lang_info['name']}:"""
+    
+    def build_prompt(
+        self,
+        query: str,
+        chunks: List[Dict[str, Any]],
+        book_filenames: List[str] = None,
+        target_language: str = "en-US"
+    ) -> str:
+        """Educational prompt over the retrieved chunks, or a general one when there are none"""
+        lang_info = self.language_prompts.get(target_language, self.language_prompts["en-US"])
+        if not chunks:
+            return self._create_simple_prompt(query, lang_info)
+        context_string = self._build_context(chunks, book_filenames)
+        return self._create_multilingual_educational_prompt(query, context_string, lang_info)
+    
+    async def stream_response(self, prompt: str) -> AsyncIterator[str]:
+        """Yield the answer text as Gemini streams it (holding a Gemini stage slot throughout)"""
+        async with gemini_stage.limit():
+            response = await self.model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue  # Chunk without text parts (e.g. only safety metadata)
+                if text:
+                    yield text
+    
+    async def generate(self, prompt: str):
+        """
+        Generate a full (non-streamed) response through the Gemini stage's
+        scheduler, coalesced with identical in-flight prompts
+        """
+        return await self.single_flight.run(prompt, gemini_stage.run, self.model.generate_content_async, prompt)
+    
+    async def generate_simple_response(self, query: str, target_language: str = "en-US") -> Dict[str, Any]:
+        """
+        Generate a simple response without context in specified language
+        Returns: Dict with 'success' and 'answer' (the error message when generation failed)
+        """
+        try:
+            lang_info = self.language_prompts.get(target_language, self.language_prompts["en-US"])
+            prompt = self._create_simple_prompt(query, lang_info)
             
-            response = self.model.generate_content(prompt)
-            return response.text if response.text else f"I couldn't generate a response in {lang_info['name']}."
+            response = await self.generate(prompt)
+            if not response.text:
+                return {"success": False, "answer": f"I couldn't generate a response in {lang_info['name']}."}
+            return {"success": True, "answer": response.text}
             
+        except UpstreamBusyError:
+            raise
         except Exception as e:
             lang_name = self.language_prompts.get(target_language, {}).get("name", "English")
-            return f"Error generating {lang_name} response: {str(e)}"
+            error_message = f"Error generating {lang_name} response: {str(e)}"
+            print(error_message)
+            return {"success": False, "answer": error_message}
     
     # gemini_client.py
 
 # ... (existing imports and GeminiClient class definition) ...
 
-    def generate_educational_response(
+    async def generate_educational_response(
         self,
         query: str,
         chunks: List[Dict[str, Any]],
@@ -152,21 +206,18 @@ Response in {lang_info['name']}:"""
             
             # Handle case where no chunks are found
             if not chunks:
-                simple_response =self.generate_simple_response(query, target_language)
+                simple_response = await self.generate_simple_response(query, target_language)
                 return {
-                    "success": True,
-                    "answer": simple_response,
+                    "success": simple_response["success"],
+                    "answer": simple_response["answer"],
                     "note": "No relevant textbook content found. Generated a general response."
                 }
-            # 2. Build the context string
-            context_string = self._build_context(chunks, book_filenames)
-            
-            # 3. Create the full educational prompt
-            prompt = self._create_multilingual_educational_prompt(query, context_string, lang_info)
+            # 2. Build the educational prompt from the retrieved context
+            prompt = self.build_prompt(query, chunks, book_filenames, target_language)
 
-            # 4. Call the Gemini API
+            # 3. Call the Gemini API
             print(f"Sending prompt to Gemini for language: {lang_info['name']}")
-            response = self.model.generate_content(prompt)
+            response = await self.generate(prompt)
             
             # Return the response text
             final_answer= response.text if response.text else f"I couldn't generate a specific response in {lang_info['name']} based on the provided content."
@@ -174,11 +225,14 @@ Response in {lang_info['name']}:"""
             return {
                 "success": True,
                 "answer": final_answer,
-                "note": None
+                "note": None,
+                "prompt_tokens": self.prompt_tokens(prompt, response)
             }
 
 
 
+        except UpstreamBusyError:
+            raise
         except Exception as e:
             lang_name = self.language_prompts.get(target_language, {}).get("name", "English")
             error_message = f"Error generating educational response in {lang_name}: {str(e)}"
@@ -187,19 +241,30 @@ Response in {lang_info['name']}:"""
                 "answer": error_message,
                 "note": "An error occurred while generating the AI response."}
         
+    def prompt_tokens(self, prompt: str, response=None) -> int:
+        """Prompt size in tokens, as counted by Gemini when a response reports it"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage and getattr(usage, "prompt_token_count", None):
+            return usage.prompt_token_count
+        return self.context_packer.estimate_tokens(prompt)
+    
     def _build_context(self, chunks: List[Dict[str, Any]], book_filenames: List[str] = None) -> str:
-        """Build context string from relevant chunks"""
-        context_parts = []
+        """Build context string from relevant chunks, packed into the context token budget"""
+        passages, packing = self.context_packer.pack(chunks, book_filenames)
+        print(f"Packed {packing['chunks']} chunks into {packing['passages']} passages "
+              f"(~{packing['context_tokens']} tokens, {packing['merged']} merged, "
+              f"{packing['duplicates_dropped']} duplicates, {packing['over_budget_dropped']} over budget)")
         
-        for i, chunk in enumerate(chunks):
+        context_parts = []
+        for i, passage in enumerate(passages):
             chunk_info = f"Source {i+1}"
-            if book_filenames and i < len(book_filenames):
-                chunk_info += f" (from {book_filenames[i]})"
+            if passage["book_filename"]:
+                chunk_info += f" (from {passage['book_filename']})"
             
-            if chunk.get('chapter'):
-                chunk_info += f" - {chunk['chapter']}"
+            if passage["chapter"]:
+                chunk_info += f" - {passage['chapter']}"
             
-            context_parts.append(f"{chunk_info}:\n{chunk['content']}\n")
+            context_parts.append(f"{chunk_info}:\n{passage['content']}\n")
         
         return "\n---\n".join(context_parts)
 
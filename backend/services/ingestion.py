@@ -0,0 +1,116 @@
+import mmap
+import os
+from bson import ObjectId
+from fastapi import HTTPException
+from typing import Dict, Any, List
+from database import database
+from models.book import Book
+from models.chunk import Chunk
+from services.pdf_processor import PDFProcessor, StreamingChunker
+from services.text_store import book_text_store, raw_text_store, CHUNK_CONTENT_STORAGE
+
+CHUNK_INSERT_BATCH_SIZE = int(os.getenv("CHUNK_INSERT_BATCH_SIZE", "500"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_EXTRACT_PAGES_PER_TASK = int(os.getenv("PDF_EXTRACT_PAGES_PER_TASK", "8"))
+
+
+def ingest_pdf_file(pdf_path: str, filename: str, content_hash: str = None) -> Dict[str, Any]:
+    """
+    Extract, chunk and store a PDF that was spooled to disk
+    The file is memory-mapped and read one page at a time (page ranges are
+    extracted on a process pool for larger books); chunks are cut
+    as pages arrive and inserted in batches, so only a few pages of text
+    and one batch of chunks are held at once. With CHUNK_CONTENT_STORAGE=offsets
+    the cleaned text is compressed into the book text store as it is produced
+    and chunks keep only their offsets. The raw text goes to the raw text
+    store, never the book document. The book document is written last,
+    and on any failure the chunks and texts already stored are removed
+    Args:
+        pdf_path: Path of the spooled PDF
+        filename: Original upload filename
+        content_hash: sha256 fingerprint of the PDF bytes
+    Returns: Summary of the stored book (ids, sizes, previews)
+    """
+    books_collection = database.get_books_collection()
+    chunks_collection = database.get_chunks_collection()
+
+    book_id = ObjectId()
+    inline_content = CHUNK_CONTENT_STORAGE != "offsets"
+    text_writer = None if inline_content else book_text_store.open_writer(str(book_id))
+    chunker = StreamingChunker(str(book_id), text_sink=text_writer.write if text_writer else None)
+    raw_writer = raw_text_store.open_writer(str(book_id))
+    raw_stats = {"first": None, "end": 0, "preview": ""}  # Extent of non-whitespace text, for validation
+    pending_chunks: List[Chunk] = []
+    stats = {"chunks": 0, "chunk_chars": 0, "first_chunk": None}
+
+    def flush_chunks(force: bool = False):
+        if not pending_chunks or (len(pending_chunks) < CHUNK_INSERT_BATCH_SIZE and not force):
+            return
+        if stats["first_chunk"] is None:
+            stats["first_chunk"] = pending_chunks[0].content
+        chunks_collection.insert_many([chunk.to_dict(inline_content) for chunk in pending_chunks], ordered=False)
+        stats["chunks"] += len(pending_chunks)
+        stats["chunk_chars"] += sum(chunk.char_count for chunk in pending_chunks)
+        pending_chunks.clear()
+
+    try:
+        with open(pdf_path, "rb") as pdf_file, mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as pdf_map:
+            pdf_reader, total_pages = PDFProcessor.open_pdf(pdf_map)
+
+            # Large books are extracted on the process pool, small ones inline
+            if PDF_EXTRACT_WORKERS > 1 and total_pages > PDF_EXTRACT_PAGES_PER_TASK:
+                page_texts = PDFProcessor.iter_page_texts_parallel(
+                    pdf_path, total_pages, PDF_EXTRACT_WORKERS, PDF_EXTRACT_PAGES_PER_TASK
+                )
+            else:
+                page_texts = PDFProcessor.iter_page_texts(pdf_reader)
+
+            for page_text in page_texts:
+                if page_text.strip():
+                    if raw_stats["first"] is None:
+                        raw_stats["first"] = raw_writer.text_length + len(page_text) - len(page_text.lstrip())
+                    raw_stats["end"] = raw_writer.text_length + len(page_text.rstrip())
+                if len(raw_stats["preview"]) <= 500:
+                    raw_stats["preview"] += page_text[:501 - len(raw_stats["preview"])]
+                raw_writer.write(page_text)
+                pending_chunks.extend(chunker.feed(page_text))
+                flush_chunks()
+
+            pending_chunks.extend(chunker.finish())
+            flush_chunks(force=True)
+
+        text_length = raw_writer.text_length
+        
+        # Basic validation
+        if raw_stats["first"] is None or raw_stats["end"] - raw_stats["first"] < 100:
+            raise HTTPException(status_code=400, detail="PDF appears to be empty or unreadable")
+        
+        raw_writer.close()
+        if text_writer:
+            text_writer.close()
+        
+        print(f"DEBUG: Extracted {text_length} characters from {total_pages} pages into {stats['chunks']} chunks")
+
+        # Create book object and save to MongoDB
+        book_dict = Book(filename, total_pages, text_length, content_hash).to_dict()
+        book_dict["_id"] = book_id
+        books_collection.insert_one(book_dict)
+
+    except BaseException:
+        chunks_collection.delete_many({"book_id": str(book_id)})
+        raw_writer.abort()
+        raw_text_store.delete(str(book_id))
+        if text_writer:
+            text_writer.abort()
+            book_text_store.delete(str(book_id))
+        raise
+
+    return {
+        "book_id": str(book_id),
+        "total_pages": total_pages,
+        "text_length": text_length,
+        "text_preview": raw_stats["preview"][:500] + "..." if len(raw_stats["preview"]) > 500 else raw_stats["preview"],
+        "chunks_created": stats["chunks"],
+        "average_chunk_size": stats["chunk_chars"] // stats["chunks"] if stats["chunks"] else 0,
+        "chunk_preview": stats["first_chunk"][:200] + "..." if stats["first_chunk"] else "No chunks created"
+    }
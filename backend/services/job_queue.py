@@ -0,0 +1,180 @@
+import os
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, Any, Optional
+from database import database
+
+# Job states; queued and running jobs are "active" (at most one per book)
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class LeaseLostError(Exception):
+    """The job was taken over by another worker after its lease expired"""
+
+
+class EmbeddingJobQueue:
+    def __init__(self, collection, max_attempts: int = 3, lease_seconds: int = 600, retry_delay_seconds: int = 30):
+        """
+        Durable embedding job queue stored in MongoDB
+        Jobs survive API restarts, are claimed atomically by worker processes
+        and are retried with backoff; a worker that dies mid-job loses its
+        lease and the job is picked up again
+        Args:
+            collection: MongoDB collection holding the jobs
+            max_attempts: Attempts before a job is marked failed
+            lease_seconds: How long a claim lasts without a heartbeat
+            retry_delay_seconds: Base delay before a failed attempt is retried
+        """
+        self.collection = collection
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_delay_seconds = retry_delay_seconds
+
+    def create_indexes(self):
+        # Deduplication: only one active job per book
+        self.collection.create_index(
+            "book_id",
+            unique=True,
+            partialFilterExpression={"active": True},
+            name="one_active_job_per_book"
+        )
+        self.collection.create_index([("state", 1), ("run_after", 1), ("created_at", 1)])
+
+    def enqueue(self, book_id: str) -> Dict[str, Any]:
+        """
+        Queue embedding generation for a book
+        Returns: The new job, or the book's already queued/running job
+        """
+        now = datetime.now()
+        try:
+            job = self.collection.find_one_and_update(
+                {"book_id": book_id, "active": True},
+                {"$setOnInsert": {
+                    "book_id": book_id,
+                    "active": True,
+                    "state": QUEUED,
+                    "attempts": 0,
+                    "created_at": now,
+                    "updated_at": now,
+                    "run_after": now,
+                    "error": None
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost a race with a concurrent enqueue for the same book
+            job = self.collection.find_one({"book_id": book_id, "active": True})
+        return job
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest runnable job (or one whose lease expired)"""
+        now = datetime.now()
+        # A job whose worker died on every attempt (OOM, segfault) is given up, not reclaimed forever
+        self.collection.update_many(
+            {"state": RUNNING, "lease_expires_at": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"state": FAILED, "updated_at": now, "finished_at": now, "error": "Worker stopped without finishing the job (lease expired)"},
+             "$unset": {"active": "", "lease_expires_at": ""}}
+        )
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"state": QUEUED, "run_after": {"$lte": now}},
+                {"state": RUNNING, "lease_expires_at": {"$lt": now}, "attempts": {"$lt": self.max_attempts}}
+            ]},
+            {
+                "$set": {
+                    "state": RUNNING,
+                    "worker_id": worker_id,
+                    "started_at": now,
+                    "updated_at": now,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds)
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def heartbeat(self, job_id: ObjectId, worker_id: str) -> bool:
+        """Extend the lease of a running job; False if another worker took it over"""
+        now = datetime.now()
+        result = self.collection.update_one(
+            {"_id": job_id, "state": RUNNING, "worker_id": worker_id},
+            {"$set": {"updated_at": now, "lease_expires_at": now + timedelta(seconds=self.lease_seconds)}}
+        )
+        return result.matched_count == 1
+
+    def complete(self, job_id: ObjectId, worker_id: str, chunks_embedded: int) -> bool:
+        """Mark a job done; False if the worker no longer holds its lease"""
+        now = datetime.now()
+        result = self.collection.update_one(
+            {"_id": job_id, "state": RUNNING, "worker_id": worker_id},
+            {"$set": {"state": COMPLETED, "updated_at": now, "finished_at": now, "chunks_embedded": chunks_embedded, "error": None},
+             "$unset": {"active": "", "lease_expires_at": ""}}
+        )
+        return result.matched_count == 1
+
+    def fail(self, job: Dict[str, Any], error: str):
+        """Requeue with exponential backoff, or mark failed after max_attempts (only while the claim holds)"""
+        now = datetime.now()
+        if job["attempts"] < self.max_attempts:
+            delay = self.retry_delay_seconds * (2 ** (job["attempts"] - 1))
+            self.collection.update_one(
+                {"_id": job["_id"], "state": RUNNING, "worker_id": job["worker_id"]},
+                {"$set": {"state": QUEUED, "updated_at": now, "run_after": now + timedelta(seconds=delay), "error": error},
+                 "$unset": {"lease_expires_at": ""}}
+            )
+        else:
+            self.collection.update_one(
+                {"_id": job["_id"], "state": RUNNING, "worker_id": job["worker_id"]},
+                {"$set": {"state": FAILED, "updated_at": now, "finished_at": now, "error": error},
+                 "$unset": {"active": "", "lease_expires_at": ""}}
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not ObjectId.is_valid(job_id):
+            return None
+        return self.collection.find_one({"_id": ObjectId(job_id)})
+
+    def latest_for_book(self, book_id: str) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({"book_id": book_id}, sort=[("created_at", -1)])
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            state: self.collection.count_documents({"state": state})
+            for state in (QUEUED, RUNNING, COMPLETED, FAILED)
+        }
+
+
+def serialize_job(job: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Job document as a JSON-friendly status dict"""
+    if not job:
+        return None
+    return {
+        "job_id": str(job["_id"]),
+        "book_id": job["book_id"],
+        "state": job["state"],
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "chunks_embedded": job.get("chunks_embedded"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at")
+    }
+
+
+# Global embedding job queue
+embedding_jobs = EmbeddingJobQueue(
+    database.get_jobs_collection(),
+    max_attempts=int(os.getenv("EMBEDDING_JOB_MAX_ATTEMPTS", "3")),
+    lease_seconds=int(os.getenv("EMBEDDING_JOB_LEASE_SECONDS", "600"))
+)
+
+try:
+    embedding_jobs.create_indexes()
+except Exception as e:
+    print(f"Warning: Could not create job queue indexes: {e}")
@@ -1,12 +1,22 @@
-import requests
+import asyncio
+import httpx
 import os
-import json
-import time
-from typing import Dict, List, Any, Optional
+import random
+import re
+import shutil
+from typing import Dict, List, Any, Optional, AsyncIterator
 from dotenv import load_dotenv
+from services.audio_cache import audio_cache
+from services.concurrency import murf_stage, SingleFlight
 
 load_dotenv()
 
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Sentence ends, including the danda used by Hindi, Marathi and Bengali
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?।])\s+')
+
 class MurfClient:
     def __init__(self):
         self.api_key = os.getenv("MURF_API_KEY")
@@ -19,59 +29,217 @@ class MurfClient:
             "Content-Type": "application/json"
         }
         
-        # Create audio storage directory
-        self.audio_dir = "audio_files"
-        os.makedirs(self.audio_dir, exist_ok=True)
+        self.max_retries = int(os.getenv("MURF_MAX_RETRIES", "3"))
+        self.retry_backoff = float(os.getenv("MURF_RETRY_BACKOFF_SECONDS", "0.5"))
+        self.max_retry_delay = float(os.getenv("MURF_MAX_RETRY_DELAY_SECONDS", "10"))
+        
+        # Long text is synthesized in segments (Murf accepts at most 3000 characters)
+        self.segment_chars = min(int(os.getenv("MURF_SEGMENT_CHARS", "1500")), 3000)
+        self.first_segment_chars = int(os.getenv("MURF_FIRST_SEGMENT_CHARS", "300"))
+        self.segment_concurrency = int(os.getenv("MURF_SEGMENT_CONCURRENCY", "3"))
+        
+        # One keep-alive pool for the API and the audio downloads; the API key
+        # is sent per request so it never goes to the audio file host
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                float(os.getenv("MURF_READ_TIMEOUT", "60")),
+                connect=float(os.getenv("MURF_CONNECT_TIMEOUT", "5"))
+            ),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("MURF_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.getenv("MURF_MAX_KEEPALIVE_CONNECTIONS", "10"))
+            )
+        )
+        
+        # Generated audio is stored (and reused) through the content-addressed cache
+        self.audio_cache = audio_cache
+        self.audio_dir = audio_cache.audio_dir
+        
+        # Identical syntheses requested at the same time share one Murf call
+        self.single_flight = SingleFlight("murf")
         
         print("Murf AI client initialized successfully")
     
-    def get_voices(self) -> Dict[str, Any]:
+    async def close(self):
+        await self.client.aclose()
+    
+    async def get_voices(self) -> Dict[str, Any]:
         """Get available voices from Murf AI"""
         try:
-            response = requests.get(f"{self.base_url}/speech/voices", headers=self.headers)
+            response = await self._request("GET", f"{self.base_url}/speech/voices", headers=self.headers)
             response.raise_for_status()
             return response.json()
         except Exception as e:
             print(f"Error getting voices: {e}")
             return {"voices": []}
     
-    def generate_audio(self, text: str, voice_id: str = "en-US-ken") -> Dict[str, Any]:
+    async def generate_audio(self, text: str, voice_id: str = "en-US-ken") -> Dict[str, Any]:
         """
         Generate audio from text using Murf AI
+        Long text is synthesized as concurrent sentence-aligned segments and
+        joined into one file (the segments are listed as a playlist too)
         Args:
             text: Text to convert to speech
             voice_id: Voice ID to use
-            language: Language code
         Returns: Dict with audio info or error
         """
-        try:
-
-            # Get language info
-            lang_info = self.get_language_from_voice(voice_id)
-
-            # Clean text for TTS
-            cleaned_text = self._clean_text_for_tts(text)
+        segments = self.prepare_segments(text)
+        results = [result async for result in self.iter_audio_segments(segments, voice_id)]
+        return await self.combine_segments(results, voice_id)
+    
+    def prepare_segments(self, text: str) -> List[str]:
+        """Clean text for TTS and split it into segments at sentence boundaries"""
+        cleaned_text = self._clean_text_for_tts(text)
+        segments = []
+        current = ""
+        for sentence in SENTENCE_BOUNDARY.split(cleaned_text):
+            # The first segment is kept short so playback can start sooner
+            limit = self.first_segment_chars if not segments else self.segment_chars
             
-            if len(cleaned_text) > 3000:  # Murf has text length limits
-                cleaned_text = cleaned_text[:2900] + "..."
-                
-            print(f"Generating audio for text length: {len(cleaned_text)} chars in {lang_info['name']}")
+            # Sentences longer than a segment are cut at spaces
+            while len(sentence) > self.segment_chars:
+                cut = sentence.rfind(" ", 0, self.segment_chars)
+                cut = cut if cut > 0 else self.segment_chars
+                if current:
+                    segments.append(current)
+                    current = ""
+                segments.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
             
-            # Prepare request payload
-            payload = {
-                "voiceId": voice_id,
-                "text": cleaned_text,
-                "rate": 0,  # Normal speed
-                "pitch": 0,  # Normal pitch
-                "sampleRate": 48000,
-                "format": "MP3",
-                "channelType": "MONO",
-                "pronunciationDictionary": {},
-                "encodeAsBase64": False
+            if current and len(current) + 1 + len(sentence) > limit:
+                segments.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            segments.append(current)
+        return segments
+    
+    async def iter_audio_segments(self, segments: List[str], voice_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Synthesize segments concurrently, yielding each result in order as soon
+        as it and every segment before it are ready
+        """
+        semaphore = asyncio.Semaphore(self.segment_concurrency)
+        
+        async def synthesize(segment: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.synthesize_segment(segment, voice_id)
+        
+        # Earlier segments acquire the semaphore first
+        tasks = [asyncio.create_task(synthesize(segment)) for segment in segments]
+        try:
+            for index, task in enumerate(tasks):
+                yield {"index": index, "total": len(tasks), **(await task)}
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def synthesize_segment(self, segment: str, voice_id: str) -> Dict[str, Any]:
+        """
+        Synthesize one prepared segment, within the global Murf concurrency cap
+        Cached audio is served without being scheduled; concurrent requests
+        for the same payload wait for the first one
+        """
+        lang_info = self.get_language_from_voice(voice_id)
+        payload = self._payload(segment, voice_id)
+        cache_key = self.audio_cache.key(segment, voice_id, {name: value for name, value in payload.items() if name != "text"})
+        
+        # Identical text, voice and format were synthesized before
+        cached_filename = self.audio_cache.get(cache_key)
+        if cached_filename:
+            print(f"Audio cache hit: {cached_filename}")
+            return self._audio_result(cached_filename, voice_id, lang_info, segment, cached=True)
+        
+        return await self.single_flight.run(
+            cache_key, murf_stage.run, self._synthesize_segment, payload, cache_key, lang_info
+        )
+    
+    async def combine_segments(self, results: List[Dict[str, Any]], voice_id: str) -> Dict[str, Any]:
+        """Final response for synthesized segments: one file plus the ordered playlist"""
+        if not results:
+            return {"success": False, "error": "No text to convert to speech", "audio_url": None}
+        
+        if len(results) == 1:
+            return {name: value for name, value in results[0].items() if name not in ("index", "total")}
+        
+        playlist = [
+            {
+                "index": result["index"],
+                "audio_url": result.get("audio_url"),
+                "text_length": result.get("text_length"),
+                "cached": result.get("cached", False)
             }
+            for result in results
+        ]
+        failed = [result for result in results if not result.get("success")]
+        if failed:
+            return {"success": False, "error": failed[0].get("error"), "audio_url": None, "segments": playlist}
+        
+        # Join the MP3 segments into one file, itself content-addressed by its parts
+        filenames = [result["audio_filename"] for result in results]
+        cache_key = self.audio_cache.key("\n".join(filenames), voice_id, {"concatenated": True})
+        audio_filename = await self.single_flight.run(cache_key, self._combined_file, cache_key, filenames)
+        
+        text_length = sum(result["text_length"] for result in results)
+        return {
+            "success": True,
+            "audio_filename": audio_filename,
+            "audio_url": f"/audio/{audio_filename}",
+            "voice_id": voice_id,
+            "language": results[0]["language"],
+            "text_length": text_length,
+            "duration_estimate": text_length / 150,  # Rough estimate: 150 chars per minute
+            "cached": all(result["cached"] for result in results),
+            "segments": playlist
+        }
+    
+    async def _combined_file(self, cache_key: str, filenames: List[str]) -> str:
+        audio_filename = self.audio_cache.get(cache_key)
+        if not audio_filename:
+            audio_filename = self.audio_cache.filename(cache_key)
+            await asyncio.get_running_loop().run_in_executor(None, self._concatenate, filenames, audio_filename)
+            self.audio_cache.add(audio_filename)
+        return audio_filename
+    
+    def _concatenate(self, filenames: List[str], audio_filename: str):
+        """Write the segment files back to back (MP3 frames can simply be appended)"""
+        audio_path = self.audio_cache.path(audio_filename)
+        temp_path = f"{audio_path}.part"
+        try:
+            with open(temp_path, "wb") as output:
+                for filename in filenames:
+                    with open(self.audio_cache.path(filename), "rb") as segment_file:
+                        shutil.copyfileobj(segment_file, output, DOWNLOAD_CHUNK_SIZE)
+            os.replace(temp_path, audio_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def _payload(self, cleaned_text: str, voice_id: str) -> Dict[str, Any]:
+        """Murf request payload for one segment"""
+        return {
+            "voiceId": voice_id,
+            "text": cleaned_text,
+            "rate": 0,  # Normal speed
+            "pitch": 0,  # Normal pitch
+            "sampleRate": 48000,
+            "format": "MP3",
+            "channelType": "MONO",
+            "pronunciationDictionary": {},
+            "encodeAsBase64": False
+        }
+    
+    async def _synthesize_segment(self, payload: Dict[str, Any], cache_key: str, lang_info: Dict[str, str]) -> Dict[str, Any]:
+        """Synthesize one segment payload with a Murf request"""
+        voice_id = payload["voiceId"]
+        cleaned_text = payload["text"]
+        try:
+            print(f"Generating audio for text length: {len(cleaned_text)} chars in {lang_info['name']}")
             
             # Make request to Murf AI
-            response = requests.post(
+            response = await self._request(
+                "POST",
                 f"{self.base_url}/speech/generate",
                 headers=self.headers,
                 json=payload
@@ -91,24 +259,12 @@ class MurfClient:
             result = response.json()
             
             if "audioFile" in result:
-                # Save audio file
-                audio_filename = f"audio_{int(time.time())}_{voice_id.replace('-', '_')}.mp3"
-                audio_path = os.path.join(self.audio_dir, audio_filename)
+                # Stream the audio to disk under its content address
+                audio_filename = self.audio_cache.filename(cache_key)
+                await self._download(result["audioFile"], self.audio_cache.path(audio_filename))
+                self.audio_cache.add(audio_filename)
                 
-                # Download and save audio
-                audio_response = requests.get(result["audioFile"])
-                with open(audio_path, "wb") as f:
-                    f.write(audio_response.content)
-                
-                return {
-                    "success": True,
-                    "audio_filename": audio_filename,
-                    "audio_url": f"/audio/{audio_filename}",
-                    "voice_id": voice_id,
-                    "language": lang_info["name"],
-                    "text_length": len(cleaned_text),
-                    "duration_estimate": len(cleaned_text) / 150  # Rough estimate: 150 chars per minute
-                }
+                return self._audio_result(audio_filename, voice_id, lang_info, cleaned_text, cached=False)
             else:
                 return {
                     "success": False,
@@ -124,6 +280,68 @@ class MurfClient:
                 "audio_url": None
             }
     
+    def _audio_result(self, audio_filename: str, voice_id: str, lang_info: Dict[str, str], cleaned_text: str, cached: bool) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "audio_filename": audio_filename,
+            "audio_url": f"/audio/{audio_filename}",
+            "voice_id": voice_id,
+            "language": lang_info["name"],
+            "text_length": len(cleaned_text),
+            "duration_estimate": len(cleaned_text) / 150,  # Rough estimate: 150 chars per minute
+            "cached": cached
+        }
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request, retrying connection errors, timeouts and 429/5xx responses"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Murf request failed ({e!r}), retrying")
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+            
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+            print(f"Murf API returned {response.status_code}, retrying")
+            await asyncio.sleep(self._retry_delay(attempt, response))
+    
+    async def _download(self, url: str, path: str):
+        """Stream a file to disk in chunks, via a temp file so a failed download leaves nothing behind"""
+        temp_path = f"{path}.part"
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.client.stream("GET", url) as response:
+                    if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                        print(f"Audio download returned {response.status_code}, retrying")
+                        await asyncio.sleep(self._retry_delay(attempt, response))
+                        continue
+                    response.raise_for_status()
+                    with open(temp_path, "wb") as f:
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                os.replace(temp_path, path)
+                return
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Audio download failed ({e!r}), retrying")
+                await asyncio.sleep(self._retry_delay(attempt))
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+    
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Honour Retry-After, otherwise exponential backoff with full jitter"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.max_retry_delay)
+        return random.uniform(0, min(self.max_retry_delay, self.retry_backoff * (2 ** attempt)))
+    
     def _clean_text_for_tts(self, text: str) -> str:
         """Clean text for text-to-speech conversion"""
         import re
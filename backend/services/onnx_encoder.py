@@ -0,0 +1,76 @@
+import numpy as np
+import os
+from typing import List, Union
+
+
+class OnnxSentenceEncoder:
+    def __init__(self, model_dir: str, model_file: str = "model_quantized.onnx", max_length: int = 256, num_threads: int = 0):
+        """
+        CPU sentence encoder running an exported transformer with onnxruntime
+        Reproduces the all-MiniLM-L6-v2 SentenceTransformer pipeline
+        (tokenize -> transformer -> mean pooling -> L2 normalize) without torch
+        Args:
+            model_dir: Directory written by export_onnx.py (tokenizer.json + .onnx files)
+            model_file: ONNX file to run (model.onnx or the int8 model_quantized.onnx)
+            max_length: Token limit, matches the SentenceTransformer max_seq_length
+            num_threads: Intra-op threads (0 lets onnxruntime decide)
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, convert_to_tensor: bool = False, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """
+        Encode sentences, same call shape as SentenceTransformer.encode
+        Returns: 1D array for a single string, otherwise (n, dim) array
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        if not sentences:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # Encode in length order so each batch pads to similar lengths
+        order = np.argsort([-len(sentence) for sentence in sentences], kind="stable")
+        embeddings = [None] * len(sentences)
+
+        for start in range(0, len(sentences), batch_size):
+            batch_indices = order[start:start + batch_size]
+            batch_embeddings = self._encode_batch([sentences[i] for i in batch_indices])
+            for i, embedding in zip(batch_indices, batch_embeddings):
+                embeddings[i] = embedding
+
+        embeddings = np.stack(embeddings)
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, sentences: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(sentences)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalize
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
@@ -1,11 +1,162 @@
 import PyPDF2
 import io
+import mmap
+import multiprocessing
+import os
 import re
+import threading
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from fastapi import HTTPException
-from typing import List, Tuple
+from typing import List, Tuple, Iterator, BinaryIO, Callable
 from models.chunk import Chunk
 
+_extract_pool = None
+_extract_pool_workers = 0
+_extract_pool_lock = threading.Lock()
+
+
+def _get_extract_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Shared process pool for page extraction, created on first use
+    Workers are spawned, not forked: the API process runs pymongo, batcher
+    and BLAS threads, and forking it from an ingest thread can deadlock
+    """
+    global _extract_pool, _extract_pool_workers
+    with _extract_pool_lock:
+        if _extract_pool is None or _extract_pool_workers != workers:
+            if _extract_pool is not None:
+                _extract_pool.shutdown(wait=False)
+            _extract_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _extract_pool_workers = workers
+        return _extract_pool
+
+
+def _extract_page_range(pdf_path: str, first_page: int, last_page: int) -> List[str]:
+    """
+    Process pool task: extract pages [first_page, last_page) of a PDF on disk
+    The file is closed before returning so a deleted upload spool is never kept alive by a worker
+    """
+    with open(pdf_path, "rb") as pdf_file, mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as pdf_map:
+        pdf_reader = PyPDF2.PdfReader(pdf_map)
+        return [
+            PDFProcessor._page_marker_text(page_num, pdf_reader.pages[page_num].extract_text())
+            for page_num in range(first_page, last_page)
+        ]
+
+
+
+# Heading patterns, matched against a single stripped line. Headings carry
+# forward to every later chunk, so they are stricter than a per-chunk guess:
+# - "Chapter 3"/"Part II"/"Unit 2"/"Section 4" (any case) starting a line is a
+#   chapter unless the line ends like a sentence
+# - the same keyword later in the line ("Science - Chapter 3 Light") and
+#   "5. The Fundamental Unit of Life" only count on title-like lines, so list
+#   items and exercises ("1. The cell is the basic unit of life",
+#   "3. Define osmosis and give an example.") are not chapters
+# - sections are numbered ("2.3 Osmosis"); "(a)", "1)" and "Note:" are not
+CHAPTER_KEYWORD = re.compile(r'\b(?:(?:chapter|part)\s+(?:\d+|[ivxlcdm]+)|(?:unit|section)\s+\d+)\b', re.IGNORECASE)
+NUMBERED_CHAPTER = re.compile(r'\d+\.\s+[^\W\d_]')
+SECTION_HEADING = re.compile(r'\d+(?:\.\d+)+\.?\s+\S')
+CHAPTER_HEADING_MAX_LENGTH = 100
+SECTION_HEADING_MAX_LENGTH = 80
+HEADING_TITLE_LENGTH = 50
+# Title-like lines: at most this many words, and any line over SHORT_TITLE_WORDS
+# words must not contain lowercase words longer than 3 letters (title case)
+TITLE_MAX_WORDS = 10
+SHORT_TITLE_WORDS = 5
+SENTENCE_ENDINGS = ('.', '?', '!', ';', ',')
+
+
+def _is_chapter_heading(title: str) -> bool:
+    keyword = CHAPTER_KEYWORD.search(title)
+    if keyword and keyword.start() == 0:
+        return not title.endswith(SENTENCE_ENDINGS)
+    if not (keyword or NUMBERED_CHAPTER.match(title)):
+        return False
+    return _is_title_like(title)
+
+
+def _is_title_like(title: str) -> bool:
+    words = title.split()
+    if len(words) > TITLE_MAX_WORDS or title.endswith(SENTENCE_ENDINGS):
+        return False
+    return len(words) <= SHORT_TITLE_WORDS or not any(word[0].islower() and len(word) > 3 for word in words)
+
+
 class PDFProcessor:
+    @staticmethod
+    def open_pdf(pdf_stream: BinaryIO) -> Tuple[PyPDF2.PdfReader, int]:
+        """
+        Open a PDF from a seekable stream (file, mmap or BytesIO)
+        Returns: (pdf_reader, total_pages)
+        """
+        try:
+            pdf_reader = PyPDF2.PdfReader(pdf_stream)
+            return pdf_reader, len(pdf_reader.pages)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+    
+    @staticmethod
+    def iter_page_texts(pdf_reader: PyPDF2.PdfReader) -> Iterator[str]:
+        """
+        Lazily extract text page by page
+        Yields: Each non-empty page's text with its '--- Page N ---' marker
+        """
+        for page_num, page in enumerate(pdf_reader.pages):
+            try:
+                page_text = page.extract_text()
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+            page_text = PDFProcessor._page_marker_text(page_num, page_text)
+            if page_text:
+                yield page_text
+    
+    @staticmethod
+    def iter_page_texts_parallel(pdf_path: str, total_pages: int, workers: int, pages_per_task: int = 8) -> Iterator[str]:
+        """
+        Extract pages on a process pool, yielding them in page order
+        Page ranges are submitted ahead of the consumer but at most
+        2 * workers ranges are in flight, which bounds the text held in memory
+        Args:
+            pdf_path: PDF on disk (each worker opens it itself)
+            total_pages: Number of pages in the PDF
+            workers: Process pool size
+            pages_per_task: Pages extracted per pool task
+        Yields: Same page texts as iter_page_texts
+        """
+        pool = _get_extract_pool(workers)
+        ranges = deque(
+            (first_page, min(first_page + pages_per_task, total_pages))
+            for first_page in range(0, total_pages, pages_per_task)
+        )
+        in_flight = deque()
+        
+        try:
+            while ranges or in_flight:
+                while ranges and len(in_flight) < 2 * workers:
+                    in_flight.append(pool.submit(_extract_page_range, pdf_path, *ranges.popleft()))
+                
+                try:
+                    page_texts = in_flight.popleft().result()
+                except Exception as e:
+                    raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+                
+                for page_text in page_texts:
+                    if page_text:
+                        yield page_text
+        finally:
+            for future in in_flight:
+                future.cancel()
+    
+    @staticmethod
+    def _page_marker_text(page_num: int, page_text: str) -> str:
+        """Page text with its '--- Page N ---' marker, empty for blank pages"""
+        if not page_text.strip():  # Only add non-empty pages
+            return ""
+        return f"\n--- Page {page_num + 1} ---\n" + page_text + "\n"
+    
     @staticmethod
     def extract_text_from_pdf(pdf_content: bytes) -> tuple[str, int]:
         """
@@ -13,15 +164,10 @@ class PDFProcessor:
         Returns: (extracted_text, total_pages)
         """
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-            total_pages = len(pdf_reader.pages)
+            pdf_reader, total_pages = PDFProcessor.open_pdf(io.BytesIO(pdf_content))
             
             # Extract text from all pages
-            raw_text = ""
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                if page_text.strip():  # Only add non-empty pages
-                    raw_text += f"\n--- Page {page_num + 1} ---\n" + page_text + "\n"
+            raw_text = "".join(PDFProcessor.iter_page_texts(pdf_reader))
             
             # Basic validation
             if len(raw_text.strip()) < 100:
@@ -46,34 +192,152 @@ class PDFProcessor:
         """
         print(f"DEBUG: Starting to chunk {len(text)} characters")
         
-        # Clean text but preserve structure
-        text = PDFProcessor._clean_text(text)
-        print(f"DEBUG: After cleaning: {len(text)} characters")
-        
         # Use sliding window approach for reliable chunking
-        chunks = PDFProcessor._sliding_window_chunk(text, book_id, chunk_size, overlap)
+        chunker = StreamingChunker(book_id, chunk_size, overlap)
+        chunks = chunker.feed(text) + chunker.finish()
         
         print(f"DEBUG: Created {len(chunks)} chunks")
         return chunks
     
     @staticmethod
-    def _sliding_window_chunk(text: str, book_id: str, chunk_size: int, overlap: int) -> List[Chunk]:
+    def _clean_text(text: str) -> str:
+        """Clean extracted text but preserve structure"""
+        return PDFProcessor._clean_fragment(text).strip()
+    
+    @staticmethod
+    def _clean_fragment(text: str) -> str:
+        """Apply the cleaning patterns without stripping, so fragments can be cleaned separately"""
+        # Remove excessive whitespace but keep paragraph breaks
+        text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)  # Max 2 consecutive newlines
+        text = re.sub(r' {3,}', ' ', text)  # Reduce multiple spaces
+        text = re.sub(r'\t+', ' ', text)  # Replace tabs with single space
+        
+        # Remove common PDF artifacts but be conservative
+        text = re.sub(r'\n\s*\d+\s*\n', '\n', text)  # Standalone page numbers
+        
+        return text
+
+
+class StreamingChunker:
+    def __init__(self, book_id: str, chunk_size: int = 800, overlap: int = 100, text_sink: Callable[[str], None] = None):
         """
-        Create chunks using sliding window approach - guaranteed to capture all text
+        Sliding-window chunker that consumes text incrementally
+        Text is cleaned and chunked as pages arrive, keeping only the current
+        window in memory; the output matches cleaning and chunking the whole text.
+        Each line is scanned once for headings, building a sorted offset index,
+        and every chunk gets the chapter and section enclosing its start
+        Args:
+            book_id: Reference to parent book
+            chunk_size: Target size for each chunk (characters)
+            overlap: Overlap between chunks
+            text_sink: Receives the cleaned text as it is produced (chunk offsets index into it)
         """
+        self.book_id = book_id
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.text_sink = text_sink
+        self.raw_length = 0  # Characters fed in
+        self.text_length = 0  # Characters after cleaning
+        self._pending_raw = ""  # Uncleaned tail that later text could still change
+        self._buffer = ""  # Cleaned text from self._buffer_offset onwards
+        self._buffer_offset = 0
+        self._start = 0  # Global offset of the next window
+        self._chunk_index = 0
+        self._scan_pos = 0  # Global offset of the first line not yet scanned for headings
+        self._chapter_offsets: List[int] = []
+        self._chapter_titles: List[str] = []
+        self._section_offsets: List[int] = []
+        self._section_titles: List[str] = []
+        self._started = False
+        self._done = False
+    
+    def feed(self, raw_text: str) -> List[Chunk]:
+        """Add raw text, returning every chunk that is now complete"""
+        self.raw_length += len(raw_text)
+        text = self._pending_raw + raw_text
+        
+        # Every cleaning pattern matches only whitespace/digits, so text up to
+        # the last other character can be cleaned without seeing what follows
+        stable_end = len(text)
+        while stable_end > 0 and (text[stable_end - 1].isspace() or text[stable_end - 1].isdecimal()):
+            stable_end -= 1
+        self._pending_raw = text[stable_end:]
+        self._append_clean(PDFProcessor._clean_fragment(text[:stable_end]))
+        return self._emit(final=False)
+    
+    def finish(self) -> List[Chunk]:
+        """Flush the remaining text into the final chunks"""
+        self._append_clean(PDFProcessor._clean_fragment(self._pending_raw))
+        self._pending_raw = ""
+        # Whole-text cleaning strips trailing whitespace
+        stripped = self._buffer.rstrip()
+        self.text_length -= len(self._buffer) - len(stripped)
+        self._buffer = stripped
+        return self._emit(final=True)
+    
+    def _append_clean(self, cleaned: str):
+        if not self._started:
+            # Whole-text cleaning strips leading whitespace
+            cleaned = cleaned.lstrip()
+            self._started = bool(cleaned)
+        self._buffer += cleaned
+        self.text_length += len(cleaned)
+        if self.text_sink and cleaned:
+            self.text_sink(cleaned)
+    
+    def _scan_headings(self, final: bool):
+        """Index the headings on every complete line not scanned yet"""
+        buffer_end = len(self._buffer)
+        pos = self._scan_pos - self._buffer_offset
+        while pos < buffer_end:
+            line_end = self._buffer.find('\n', pos)
+            if line_end == -1:
+                if not final:
+                    break  # The last line may still grow
+                line_end = buffer_end
+            self._index_heading(self._buffer_offset + pos, self._buffer[pos:line_end])
+            pos = line_end + 1
+        self._scan_pos = self._buffer_offset + min(pos, buffer_end)
+    
+    def _index_heading(self, offset: int, line: str):
+        title = line.strip()
+        if len(title) >= CHAPTER_HEADING_MAX_LENGTH:
+            return  # Headings are short lines
+        offset += len(line) - len(line.lstrip())
+        if _is_chapter_heading(title):
+            self._chapter_offsets.append(offset)
+            self._chapter_titles.append(title[:HEADING_TITLE_LENGTH])
+        elif len(title) < SECTION_HEADING_MAX_LENGTH and SECTION_HEADING.match(title):
+            self._section_offsets.append(offset)
+            self._section_titles.append(title[:HEADING_TITLE_LENGTH])
+    
+    def _enclosing_headings(self, offset: int) -> Tuple[str, str]:
+        """Chapter and section in effect at a text offset (a section ends with its chapter)"""
+        chapter, chapter_offset = None, -1
+        i = bisect_right(self._chapter_offsets, offset)
+        if i:
+            chapter, chapter_offset = self._chapter_titles[i - 1], self._chapter_offsets[i - 1]
+        
+        section = None
+        j = bisect_right(self._section_offsets, offset)
+        if j and self._section_offsets[j - 1] > chapter_offset:
+            section = self._section_titles[j - 1]
+        return chapter, section
+    
+    def _emit(self, final: bool) -> List[Chunk]:
         chunks = []
-        start = 0
-        chunk_index = 0
+        self._scan_headings(final)
         
-        while start < len(text):
-            # Calculate end position
-            end = min(start + chunk_size, len(text))
+        # Before the end, a window is only cut once text exists past it
+        while not self._done and self._start < self.text_length and (final or self._start + self.chunk_size < self.text_length):
+            start = self._start
+            end = min(start + self.chunk_size, self.text_length)
             
             # Extract chunk content
-            chunk_content = text[start:end]
+            chunk_content = self._text(start, end)
             
             # Try to break at sentence boundary if we're not at the end
-            if end < len(text):
+            if end < self.text_length:
                 # Look for sentence endings in the last 200 characters
                 search_start = max(0, len(chunk_content) - 200)
                 last_sentence_end = max(
@@ -88,85 +352,40 @@ class PDFProcessor:
                     end = start + len(chunk_content)
             
             # Skip if chunk is too small (unless it's the last chunk)
-            if len(chunk_content.strip()) < 50 and end < len(text):
-                start += 100  # Skip forward a bit
+            if len(chunk_content.strip()) < 50 and end < self.text_length:
+                self._start += 100  # Skip forward a bit
                 continue
             
             # Create chunk object
-            chunk = Chunk(
-                book_id=book_id,
-                content=chunk_content.strip(),
-                chunk_index=chunk_index,
-                chapter=PDFProcessor._detect_chapter(chunk_content),
-                section=PDFProcessor._detect_section(chunk_content)
-            )
-            chunks.append(chunk)
+            content = chunk_content.strip()
+            content_start = start + len(chunk_content) - len(chunk_content.lstrip())
+            chapter, section = self._enclosing_headings(content_start)
+            chunks.append(Chunk(
+                book_id=self.book_id,
+                content=content,
+                chunk_index=self._chunk_index,
+                chapter=chapter,
+                section=section,
+                text_start=content_start,
+                text_end=content_start + len(content)
+            ))
             
             # Move start position (with overlap)
-            if end >= len(text):
-                break  # We've reached the end
+            if end >= self.text_length:
+                self._done = True  # We've reached the end
+                break
             
-            start = max(start + chunk_size - overlap, start + 1)  # Ensure progress
-            chunk_index += 1
+            self._start = max(start + self.chunk_size - self.overlap, start + 1)  # Ensure progress
+            self._chunk_index += 1
         
-        return chunks
-    
-    @staticmethod
-    def _clean_text(text: str) -> str:
-        """Clean extracted text but preserve structure"""
-        # Remove excessive whitespace but keep paragraph breaks
-        text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)  # Max 2 consecutive newlines
-        text = re.sub(r' {3,}', ' ', text)  # Reduce multiple spaces
-        text = re.sub(r'\t+', ' ', text)  # Replace tabs with single space
-        
-        # Remove common PDF artifacts but be conservative
-        text = re.sub(r'\n\s*\d+\s*\n', '\n', text)  # Standalone page numbers
+        # Drop text no future window or heading scan can reach
+        keep_from = min(self._start, self.text_length, self._scan_pos)
+        if keep_from > self._buffer_offset:
+            drop = keep_from - self._buffer_offset
+            self._buffer = self._buffer[drop:]
+            self._buffer_offset += drop
         
-        return text.strip()
-    
-    @staticmethod
-    def _detect_chapter(text: str) -> str:
-        """Try to detect chapter from text content"""
-        lines = text.split('\n')[:10]  # Check first 10 lines
-        
-        for line in lines:
-            line = line.strip()
-            if len(line) < 100:  # Only check shorter lines (likely headers)
-                # Look for chapter patterns
-                chapter_patterns = [
-                    r'chapter\s+(\d+|[ivxlcdm]+)',
-                    r'unit\s+(\d+)',
-                    r'part\s+(\d+|[ivxlcdm]+)',
-                    r'section\s+(\d+)',
-                    r'^\d+\.\s+[A-Z][a-z]'
-                ]
-                
-                for pattern in chapter_patterns:
-                    match = re.search(pattern, line, re.IGNORECASE)
-                    if match:
-                        return line[:50]  # Return first 50 chars of the line
-        
-        return None
+        return chunks
     
-    @staticmethod
-    def _detect_section(text: str) -> str:
-        """Try to detect section from text content"""
-        lines = text.split('\n')[:5]
-        
-        for line in lines:
-            line = line.strip()
-            if len(line) < 80:
-                # Look for subsection patterns
-                patterns = [
-                    r'^\d+\.\d+',
-                    r'^\d+\.\d+\.\d+',
-                    r'^[A-Z][a-z]+:',
-                    r'^\([a-z]\)',
-                    r'^\d+\)'
-                ]
-                
-                for pattern in patterns:
-                    if re.match(pattern, line):
-                        return line[:50]
-        
-        return None
\ No newline at end of file
+    def _text(self, start: int, end: int) -> str:
+        return self._buffer[start - self._buffer_offset:end - self._buffer_offset]
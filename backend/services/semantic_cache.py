@@ -0,0 +1,190 @@
+import numpy as np
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float, max_entries: int, ttl_seconds: float, dimension: int = 384):
+        """
+        Cache of answers to previously asked questions, matched by meaning
+        Each (book scope, language) pair holds a small matrix of normalized
+        query embeddings; a new question within the cosine threshold of a
+        cached one gets its answer without retrieval or generation.
+        A scope is emptied when the vector index changes for its books
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            max_entries: Entries kept per scope, least recently used go first
+            ttl_seconds: Entries older than this are never served
+            dimension: Embedding dimension
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.dimension = dimension
+        self._scopes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def scope_key(book_ids: Optional[List[str]]) -> str:
+        return ",".join(sorted(book_ids)) if book_ids else "*"
+
+    def lookup(
+        self,
+        query_embedding: List[float],
+        book_ids: Optional[List[str]],
+        language: str,
+        index_version: int
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Closest cached answer for the scope, or None
+        Returns: The cached entry with the similarity of the match
+        """
+        vector = self._normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            scope = self._scope((self.scope_key(book_ids), language), index_version)
+            if scope is not None:
+                expired = [i for i, entry in enumerate(scope["entries"]) if now - entry["created_at"] > self.ttl_seconds]
+                if expired:
+                    self._drop(scope, expired)
+            if scope is None or not scope["entries"]:
+                self.misses += 1
+                return None
+
+            scores = scope["matrix"] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = scope["entries"][best]
+            entry["hits"] += 1
+            entry["last_hit"] = now
+            self.hits += 1
+            return {**entry, "similarity": round(float(scores[best]), 4)}
+
+    def add(
+        self,
+        query_embedding: List[float],
+        book_ids: Optional[List[str]],
+        language: str,
+        index_version: int,
+        query: str,
+        response: Dict[str, Any]
+    ):
+        """Remember a successful answer to a question"""
+        if not response.get("success"):
+            return
+        vector = self._normalize(query_embedding)
+        now = time.time()
+        key = (self.scope_key(book_ids), language)
+        with self._lock:
+            scope = self._scope(key, index_version)
+            if scope is None:
+                scope = self._scopes[key] = {
+                    "version": index_version,
+                    "matrix": np.empty((0, self.dimension), dtype=np.float32),
+                    "entries": []
+                }
+            scope["matrix"] = np.concatenate([scope["matrix"], vector[None, :]])
+            scope["entries"].append({
+                "query": query,
+                "response": response,
+                "created_at": now,
+                "last_hit": now,
+                "hits": 0
+            })
+            self.stores += 1
+
+            if len(scope["entries"]) > self.max_entries:
+                self._drop(scope, [self._least_recent(scope)])
+
+    def purge(self, book_id: Optional[str] = None) -> int:
+        """
+        Drop cached answers, all of them or those whose scope can include a book
+        Returns: Number of entries dropped
+        """
+        with self._lock:
+            doomed = [
+                key for key in self._scopes
+                if book_id is None or key[0] == "*" or book_id in key[0].split(",")
+            ]
+            purged = sum(len(self._scopes.pop(key)["entries"]) for key in doomed)
+        return purged
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Cached questions per scope, for inspection"""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "book_ids": scope_key,
+                    "language": language,
+                    "index_version": scope["version"],
+                    "entries": [
+                        {
+                            "query": entry["query"],
+                            "hits": entry["hits"],
+                            "age_seconds": round(now - entry["created_at"]),
+                            "has_audio": bool(entry["response"].get("audio"))
+                        }
+                        for entry in scope["entries"]
+                    ]
+                }
+                for (scope_key, language), scope in self._scopes.items()
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "threshold": self.threshold,
+            "scopes": len(self._scopes),
+            "entries": sum(len(scope["entries"]) for scope in self._scopes.values()),
+            "max_entries_per_scope": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "stores": self.stores,
+            "evictions": self.evictions
+        }
+
+    def _scope(self, key: Tuple[str, str], index_version: int) -> Optional[Dict[str, Any]]:
+        """Scope for key, dropped first if the books behind it changed since it was filled"""
+        scope = self._scopes.get(key)
+        if scope is not None and scope["version"] != index_version:
+            self.evictions += len(scope["entries"])
+            del self._scopes[key]
+            return None
+        return scope
+
+    def _least_recent(self, scope: Dict[str, Any]) -> int:
+        return min(range(len(scope["entries"])), key=lambda i: scope["entries"][i]["last_hit"])
+
+    def _drop(self, scope: Dict[str, Any], rows: List[int]):
+        keep = np.ones(len(scope["entries"]), dtype=bool)
+        keep[rows] = False
+        scope["matrix"] = scope["matrix"][keep]
+        scope["entries"] = [entry for entry, kept in zip(scope["entries"], keep) if kept]
+        self.evictions += len(rows)
+
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(self.dimension)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+# Global semantic answer cache (None when SEMANTIC_CACHE=off)
+semantic_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(24 * 3600)))
+) if os.getenv("SEMANTIC_CACHE", "on") != "off" else None
@@ -0,0 +1,193 @@
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from threading import Lock
+from gridfs.errors import NoFile
+from typing import List, Dict, Any, Tuple, Iterator
+from database import database
+
+# "inline" keeps each chunk's content in its document, "offsets" stores only
+# (text_start, text_end) into the book's compressed text blob
+CHUNK_CONTENT_STORAGE = os.getenv("CHUNK_CONTENT_STORAGE", "inline")
+TEXT_BLOCK_CHARS = int(os.getenv("BOOK_TEXT_BLOCK_CHARS", str(64 * 1024)))
+
+# Blob trailer: one little-endian uint32 compressed size per block, then (block count, block chars)
+_TRAILER = struct.Struct("<II")
+
+
+class BookTextWriter:
+    def __init__(self, grid_in, block_chars: int):
+        """
+        Compresses a book's text into a GridFS file as it is produced
+        Text is split into fixed-size character blocks compressed separately,
+        so a slice can later be read by decompressing only the blocks it spans
+        """
+        self.grid_in = grid_in
+        self.block_chars = block_chars
+        self.text_length = 0
+        self._pending = ""
+        self._block_sizes: List[int] = []
+
+    def write(self, text: str):
+        self.text_length += len(text)
+        self._pending += text
+        while len(self._pending) >= self.block_chars:
+            self._write_block(self._pending[:self.block_chars])
+            self._pending = self._pending[self.block_chars:]
+
+    def close(self):
+        if self._pending:
+            self._write_block(self._pending)
+            self._pending = ""
+        self.grid_in.write(struct.pack(f"<{len(self._block_sizes)}I", *self._block_sizes))
+        self.grid_in.write(_TRAILER.pack(len(self._block_sizes), self.block_chars))
+        self.grid_in.close()
+
+    def abort(self):
+        self.grid_in.abort()
+
+    def _write_block(self, block: str):
+        compressed = zlib.compress(block.encode("utf-8"), 6)
+        self.grid_in.write(compressed)
+        self._block_sizes.append(len(compressed))
+
+
+class BookTextStore:
+    def __init__(self, bucket, block_chars: int = TEXT_BLOCK_CHARS, cache_blocks: int = 256):
+        """
+        Per-book text stored once, block-compressed in GridFS
+        Slices are read on demand (chunks stored with offsets are materialized
+        from here), with an LRU of decompressed blocks so neighbouring chunks
+        share reads; whole texts can be streamed block by block
+        Args:
+            bucket: GridFSBucket holding one file per book (file _id is the book id)
+            block_chars: Characters per compressed block for new books
+            cache_blocks: Decompressed blocks kept in memory
+        """
+        self.bucket = bucket
+        self.block_chars = block_chars
+        self.cache_blocks = cache_blocks
+        self._blocks: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._layouts: "OrderedDict[str, Tuple[int, List[int]]]" = OrderedDict()
+        self._lock = Lock()
+        self.block_reads = 0
+        self.cache_hits = 0
+
+    def open_writer(self, book_id: str) -> BookTextWriter:
+        grid_in = self.bucket.open_upload_stream_with_id(book_id, f"{book_id}.txt.z")
+        return BookTextWriter(grid_in, self.block_chars)
+
+    def delete(self, book_id: str):
+        try:
+            self.bucket.delete(book_id)
+        except NoFile:
+            pass
+        with self._lock:
+            self._layouts.pop(book_id, None)
+            for key in [key for key in self._blocks if key[0] == book_id]:
+                del self._blocks[key]
+
+    def read(self, book_id: str, start: int, end: int) -> str:
+        """Text [start, end) of a book"""
+        if end <= start:
+            return ""
+
+        grid_out = None
+        try:
+            block_chars, offsets = self._layout(book_id)
+            first_block, last_block = start // block_chars, (end - 1) // block_chars
+            parts = []
+            for block_number in range(first_block, last_block + 1):
+                block = self._cached_block(book_id, block_number)
+                if block is None:
+                    grid_out = grid_out or self.bucket.open_download_stream(book_id)
+                    grid_out.seek(offsets[block_number])
+                    compressed = grid_out.read(offsets[block_number + 1] - offsets[block_number])
+                    block = zlib.decompress(compressed).decode("utf-8")
+                    self._cache_block(book_id, block_number, block)
+                parts.append(block)
+        finally:
+            if grid_out is not None:
+                grid_out.close()
+
+        text = "".join(parts)
+        base = first_block * block_chars
+        return text[start - base:end - base]
+
+    def has_text(self, book_id: str) -> bool:
+        try:
+            self._layout(book_id)
+            return True
+        except NoFile:
+            return False
+
+    def iter_text(self, book_id: str) -> Iterator[str]:
+        """Stream a book's whole text block by block (bypasses the block cache)"""
+        _, offsets = self._layout(book_id)
+        with self.bucket.open_download_stream(book_id) as grid_out:
+            for block_number in range(len(offsets) - 1):
+                compressed = grid_out.read(offsets[block_number + 1] - offsets[block_number])
+                yield zlib.decompress(compressed).decode("utf-8")
+
+    def materialize(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill in 'content' for chunk documents stored as offsets (others are left as is)"""
+        for chunk in chunks:
+            if "content" not in chunk and "text_start" in chunk:
+                chunk["content"] = self.read(chunk["book_id"], chunk["text_start"], chunk["text_end"])
+        return chunks
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "storage_mode": CHUNK_CONTENT_STORAGE,
+            "cached_blocks": len(self._blocks),
+            "cache_capacity": self.cache_blocks,
+            "block_reads": self.block_reads,
+            "cache_hits": self.cache_hits
+        }
+
+    def _layout(self, book_id: str) -> Tuple[int, List[int]]:
+        """(block chars, byte offset of each block plus the end offset), read from the blob trailer"""
+        with self._lock:
+            if book_id in self._layouts:
+                self._layouts.move_to_end(book_id)
+                return self._layouts[book_id]
+
+        with self.bucket.open_download_stream(book_id) as grid_out:
+            grid_out.seek(grid_out.length - _TRAILER.size)
+            block_count, block_chars = _TRAILER.unpack(grid_out.read(_TRAILER.size))
+            grid_out.seek(grid_out.length - _TRAILER.size - 4 * block_count)
+            block_sizes = struct.unpack(f"<{block_count}I", grid_out.read(4 * block_count))
+
+        offsets = [0]
+        for size in block_sizes:
+            offsets.append(offsets[-1] + size)
+
+        with self._lock:
+            self._layouts[book_id] = (block_chars, offsets)
+            while len(self._layouts) > self.cache_blocks:
+                self._layouts.popitem(last=False)
+        return block_chars, offsets
+
+    def _cached_block(self, book_id: str, block_number: int):
+        with self._lock:
+            block = self._blocks.get((book_id, block_number))
+            if block is not None:
+                self._blocks.move_to_end((book_id, block_number))
+                self.cache_hits += 1
+            return block
+
+    def _cache_block(self, book_id: str, block_number: int, block: str):
+        with self._lock:
+            self.block_reads += 1
+            self._blocks[(book_id, block_number)] = block
+            while len(self._blocks) > self.cache_blocks:
+                self._blocks.popitem(last=False)
+
+
+# Global book text stores: cleaned text for chunk offsets, and the raw extracted text
+book_text_store = BookTextStore(
+    database.get_book_text_bucket(),
+    cache_blocks=int(os.getenv("BOOK_TEXT_CACHE_BLOCKS", "256"))
+)
+raw_text_store = BookTextStore(database.get_raw_text_bucket(), cache_blocks=16)
@@ -0,0 +1,445 @@
+import numpy as np
+import os
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+from typing import List, Dict, Any, Optional, Tuple
+from services.ann_engines import create_engine
+from services.embedding_codec import decode_embedding
+
+
+class VectorIndex:
+    # Filtered searches over at most this many rows are always exact
+    EXACT_SEARCH_MAX_ROWS = 20000
+    # Candidates fetched per requested result when an ANN search is filtered by book
+    FILTER_OVERSAMPLING = 10
+    # Re-read window for sync, covers batches committed after their embedded_at timestamp
+    SYNC_LOOKBACK = timedelta(seconds=60)
+    # Smallest row capacity allocated; capacity doubles when it runs out
+    MIN_CAPACITY = 1024
+    # Removed rows are compacted away once they exceed this share of the rows (and MIN_CAPACITY)
+    COMPACT_DEAD_FRACTION = 0.25
+
+    def __init__(self, dimension: int = 384, engine_name: str = "flat", index_dir: Optional[str] = None):
+        """
+        Process-resident index of chunk embeddings
+        Holds one contiguous float32 matrix of normalized embeddings plus
+        the matching chunk ids and int32 book codes, so a query is a single
+        matrix-vector product instead of a full scan of the chunks collection
+        and book filters are integer compares.
+        Rows live in capacity-doubling buffers: new chunks are written in
+        place and removed ones are only marked dead until a compaction, so
+        a sync batch costs O(batch) rather than a copy of the whole index
+        Args:
+            dimension: Embedding dimension
+            engine_name: Search engine, "flat" (exact), "ivf" or "hnsw"
+            index_dir: Directory to persist the index in (None disables persistence)
+        """
+        self.dimension = dimension
+        self.index_dir = index_dir
+        self.engine = create_engine(engine_name, dimension)
+        self._matrix = np.empty((0, dimension), dtype=np.float32)  # Buffers, the first _rows rows are used
+        self._chunk_ids = np.empty(0, dtype=object)
+        self._book_codes = np.empty(0, dtype=np.int32)
+        self._live = np.empty(0, dtype=bool)
+        self._rows = 0
+        self._dead = 0
+        self._row_by_chunk: Dict[Any, int] = {}
+        self._book_code_by_id: Dict[str, int] = {}
+        self._book_id_by_code: List[str] = []
+        self._book_sizes: Dict[str, int] = {}  # book_id -> live rows
+        self._synced_until = None
+        self._recently_synced = {}
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._versions: Dict[str, int] = {}  # book_id -> changes seen
+        self.generation = 0  # Changes to any book
+        self.loaded = False
+        self.engine.build(self._matrix)
+
+    @property
+    def size(self) -> int:
+        return self._rows - self._dead
+
+    def load(self, chunks_collection, books_collection) -> int:
+        """
+        Load the index from disk and catch up with MongoDB, rebuilding if they disagree
+        Returns: Number of chunks indexed
+        """
+        if self.index_dir and self._load_from_disk():
+            self.sync(chunks_collection, books_collection)
+            expected = chunks_collection.count_documents({"embedding": {"$exists": True}})
+            if self.size == expected:
+                self.loaded = True
+                print(f"Vector index loaded from {self.index_dir} with {self.size} chunks ({self.engine.name})")
+                return self.size
+            print("Persisted vector index is stale, rebuilding")
+
+        self.build(chunks_collection)
+        self.save()
+        return self.size
+
+    def build(self, chunks_collection) -> int:
+        """
+        Build the index from every embedded chunk in MongoDB
+        Only the id, book id and embedding are projected, content stays in Mongo
+        Returns: Number of chunks indexed
+        """
+        started = datetime.now()
+        cursor = chunks_collection.find(
+            {"embedding": {"$exists": True}},
+            {"_id": 1, "book_id": 1, "embedding": 1}
+        )
+
+        chunk_ids, book_ids, vectors = [], [], []
+        for chunk in cursor:
+            chunk_ids.append(chunk["_id"])
+            book_ids.append(chunk["book_id"])
+            vectors.append(decode_embedding(chunk["embedding"]))
+
+        matrix = self._normalize(np.stack(vectors) if vectors else np.empty((0, self.dimension), dtype=np.float32))
+
+        with self._lock:
+            self._touch(set(self._book_sizes) | set(book_ids))
+            self._book_code_by_id, self._book_id_by_code = {}, []
+            self._replace_rows(matrix, chunk_ids, self._encode_books(book_ids))
+            self._synced_until = started
+            self._recently_synced = {}
+            self.engine.build(self._matrix[:self._rows])
+            self._dirty = True
+            self.loaded = True
+
+        print(f"Vector index built with {self.size} chunks ({self.engine.name})")
+        return self.size
+
+    def save(self):
+        """Persist the index so a restart doesn't have to rebuild it"""
+        if not self.index_dir:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            # Saved rows and engine state must not contain dead rows
+            if self._dead:
+                self._compact()
+            os.makedirs(self.index_dir, exist_ok=True)
+            np.save(os.path.join(self.index_dir, "vectors.npy"), self._matrix[:self._rows])
+            np.savez(
+                os.path.join(self.index_dir, "ids.npz"),
+                chunk_ids=np.array([str(chunk_id) for chunk_id in self._chunk_ids[:self._rows]], dtype=str),
+                book_ids=np.array([self._book_id_by_code[code] for code in self._book_codes[:self._rows]], dtype=str),
+                engine=np.array(self.engine.name),
+                synced_until=np.array(self._synced_until.isoformat() if self._synced_until else "")
+            )
+            self.engine.save(self.index_dir)
+            self._dirty = False
+        print(f"Vector index saved to {self.index_dir}")
+
+    def add_chunks(self, chunk_ids: List[Any], book_ids: List[str], embeddings: List[List[float]]):
+        """Append newly embedded chunks, replacing any that are already indexed"""
+        if not chunk_ids:
+            return
+
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension))
+
+        with self._lock:
+            # Retire stale rows for the same chunks so re-embedding doesn't duplicate them
+            stale = [self._row_by_chunk[chunk_id] for chunk_id in chunk_ids if chunk_id in self._row_by_chunk]
+            changed_books = set(book_ids) | self._kill_rows(np.asarray(stale, dtype=np.int64))
+
+            start, end = self._rows, self._rows + len(chunk_ids)
+            self._reserve(end)
+            self._matrix[start:end] = vectors
+            self._chunk_ids[start:end] = self._object_array(chunk_ids)
+            self._book_codes[start:end] = self._encode_books(book_ids)
+            self._live[start:end] = True
+            self._rows = end
+            for row, chunk_id in enumerate(chunk_ids, start):
+                self._row_by_chunk[chunk_id] = row
+            for book_id in book_ids:
+                self._book_sizes[book_id] = self._book_sizes.get(book_id, 0) + 1
+
+            self._touch(changed_books)
+            self.engine.add(self._matrix[:end], start)
+            self._maybe_compact()
+            self._dirty = True
+
+    def remove_book(self, book_id: str) -> int:
+        """
+        Remove every chunk belonging to a book
+        Returns: Number of rows removed
+        """
+        with self._lock:
+            removed = self._book_sizes.get(book_id, 0)
+            if removed:
+                self._kill_rows(np.flatnonzero(self._book_mask([book_id])))
+                self._touch({book_id})
+                self._maybe_compact()
+                self._dirty = True
+            self._book_sizes.pop(book_id, None)
+        return removed
+
+    def sync(self, chunks_collection, books_collection) -> int:
+        """
+        Catch up with changes made by other processes (embedding workers, other API workers)
+        Adds chunks embedded since the last sync and drops books that were deleted
+        Returns: Number of chunks added
+        """
+        if self._synced_until is None:
+            return 0
+
+        started = datetime.now()
+        cursor = chunks_collection.find(
+            {"embedded_at": {"$gte": self._synced_until - self.SYNC_LOOKBACK}},
+            {"_id": 1, "book_id": 1, "embedding": 1}
+        )
+
+        chunk_ids, book_ids, vectors = [], [], []
+        for chunk in cursor:
+            if chunk["_id"] in self._recently_synced:
+                continue
+            chunk_ids.append(chunk["_id"])
+            book_ids.append(chunk["book_id"])
+            vectors.append(decode_embedding(chunk["embedding"]))
+
+        if chunk_ids:
+            self.add_chunks(chunk_ids, book_ids, np.stack(vectors))
+
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._recently_synced[chunk_id] = started
+            cutoff = started - 2 * self.SYNC_LOOKBACK
+            self._recently_synced = {
+                chunk_id: synced_at for chunk_id, synced_at in self._recently_synced.items() if synced_at >= cutoff
+            }
+            self._synced_until = started
+            indexed_books = set(self._book_sizes)
+
+        # Only the indexed books are looked up, by _id
+        existing_books = {
+            str(book["_id"])
+            for book in books_collection.find(
+                {"_id": {"$in": [ObjectId(book_id) for book_id in indexed_books if ObjectId.is_valid(book_id)]}},
+                {"_id": 1}
+            )
+        }
+        for book_id in indexed_books - existing_books:
+            self.remove_book(book_id)
+
+        if chunk_ids:
+            print(f"Vector index synced {len(chunk_ids)} new chunks")
+        return len(chunk_ids)
+
+    def count(self, book_ids: Optional[List[str]] = None) -> int:
+        """Number of indexed chunks, optionally restricted to some books"""
+        with self._lock:
+            if not book_ids:
+                return self.size
+            return sum(self._book_sizes.get(book_id, 0) for book_id in set(book_ids))
+
+    def version(self, book_ids: Optional[List[str]] = None) -> int:
+        """
+        Counter that changes whenever the indexed chunks of the given books
+        (or of any book) change, so callers can tell derived results are stale
+        Lock-free, so it can be called on the event loop while a sync holds the lock
+        """
+        if not book_ids:
+            return self.generation
+        return sum(self._versions.get(book_id, 0) for book_id in book_ids)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        book_ids: Optional[List[str]] = None,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[Any, float]]:
+        """
+        Find the most similar chunks to a query
+        Args:
+            query_embedding: Query embedding vector
+            top_k: Number of top results to return
+            book_ids: Restrict the search to these books (None searches all)
+            ef_search: HNSW candidate list size (higher = better recall, slower)
+            nprobe: IVF lists scanned (higher = better recall, slower)
+        Returns: List of (chunk_id, similarity_score), best first
+        """
+        if top_k <= 0:
+            return []
+
+        query = self._normalize(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+
+        with self._lock:
+            end = self._rows
+            mask = self._book_mask(book_ids) if book_ids else None
+            in_scope = self.size if mask is None else int(np.count_nonzero(mask))
+            if not in_scope:
+                return []
+            # Unfiltered searches score every row and rule out the dead ones afterwards
+            dead = ~self._live[:end] if mask is None and self._dead else None
+
+            if self.engine.exact or (mask is not None and in_scope <= self.EXACT_SEARCH_MAX_ROWS):
+                rows = None if mask is None else np.flatnonzero(mask)
+            else:
+                candidates = mask if mask is not None else (None if dead is None else ~dead)
+                k = top_k if candidates is None else top_k * self.FILTER_OVERSAMPLING
+                rows = self.engine.search(query, k, ef_search=ef_search, nprobe=nprobe)
+                if rows is not None and candidates is not None:
+                    rows = rows[candidates[rows]]
+                elif rows is None and mask is not None:
+                    rows = np.flatnonzero(mask)
+
+            if rows is None:
+                # Views stay valid after the lock is released: used rows are never overwritten
+                matrix, chunk_ids = self._matrix[:end], self._chunk_ids[:end]
+            else:
+                matrix, chunk_ids, dead = self._matrix[rows], self._chunk_ids[rows], None
+
+        if matrix.shape[0] == 0:
+            return []
+
+        # Cosine similarity is a dot product on normalized vectors
+        scores = matrix @ query
+        if dead is not None:
+            scores[dead] = -np.inf
+
+        # Partial selection of the top_k, then sort only those
+        k = min(top_k, in_scope, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [(chunk_ids[i], float(scores[i])) for i in top]
+
+    def _touch(self, book_ids: set):
+        self.generation += 1
+        for book_id in book_ids:
+            self._versions[book_id] = self._versions.get(book_id, 0) + 1
+
+    def _encode_books(self, book_ids: List[str]) -> np.ndarray:
+        """int32 code of each book id, assigning codes to books not seen before"""
+        codes = np.empty(len(book_ids), dtype=np.int32)
+        for i, book_id in enumerate(book_ids):
+            code = self._book_code_by_id.get(book_id)
+            if code is None:
+                code = self._book_code_by_id[book_id] = len(self._book_id_by_code)
+                self._book_id_by_code.append(book_id)
+            codes[i] = code
+        return codes
+
+    def _book_mask(self, book_ids: List[str]) -> np.ndarray:
+        """Live rows belonging to any of the books"""
+        codes = [self._book_code_by_id[book_id] for book_id in book_ids if book_id in self._book_code_by_id]
+        book_codes = self._book_codes[:self._rows]
+        if len(codes) == 1:
+            mask = book_codes == codes[0]
+        else:
+            mask = np.isin(book_codes, np.asarray(codes, dtype=np.int32))
+        if self._dead:
+            mask &= self._live[:self._rows]
+        return mask
+
+    def _kill_rows(self, rows: np.ndarray) -> set:
+        """
+        Mark rows dead (they stay in the buffers until the next compaction)
+        Returns: Books the rows belonged to
+        """
+        books = set()
+        for row in rows:
+            chunk_id = self._chunk_ids[row]
+            book_id = self._book_id_by_code[self._book_codes[row]]
+            self._row_by_chunk.pop(chunk_id, None)
+            self._book_sizes[book_id] -= 1
+            if not self._book_sizes[book_id]:
+                del self._book_sizes[book_id]
+            books.add(book_id)
+        self._live[rows] = False
+        self._dead += len(rows)
+        return books
+
+    def _reserve(self, rows: int):
+        """Grow the buffers, doubling their capacity, so they hold at least rows rows"""
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(rows, 2 * capacity, self.MIN_CAPACITY)
+        matrix = np.empty((capacity, self.dimension), dtype=np.float32)
+        matrix[:self._rows] = self._matrix[:self._rows]
+        chunk_ids = np.empty(capacity, dtype=object)
+        chunk_ids[:self._rows] = self._chunk_ids[:self._rows]
+        book_codes = np.empty(capacity, dtype=np.int32)
+        book_codes[:self._rows] = self._book_codes[:self._rows]
+        live = np.zeros(capacity, dtype=bool)
+        live[:self._rows] = self._live[:self._rows]
+        self._matrix, self._chunk_ids, self._book_codes, self._live = matrix, chunk_ids, book_codes, live
+
+    def _maybe_compact(self):
+        if self._dead > max(self.MIN_CAPACITY, self.COMPACT_DEAD_FRACTION * self._rows):
+            self._compact()
+
+    def _compact(self):
+        """Drop dead rows into fresh buffers (searches may still hold views of the old ones)"""
+        keep = self._live[:self._rows]
+        self.engine.remove(keep)
+        self._replace_rows(self._matrix[:self._rows][keep], self._chunk_ids[:self._rows][keep], self._book_codes[:self._rows][keep])
+
+    def _replace_rows(self, matrix: np.ndarray, chunk_ids: List[Any], book_codes: np.ndarray):
+        """Swap in new buffers holding exactly these live rows"""
+        rows = matrix.shape[0]
+        self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self._chunk_ids = self._object_array(list(chunk_ids))
+        self._book_codes = np.asarray(book_codes, dtype=np.int32)
+        self._live = np.ones(rows, dtype=bool)
+        self._rows = rows
+        self._dead = 0
+        self._row_by_chunk = {chunk_id: row for row, chunk_id in enumerate(self._chunk_ids)}
+        counts = np.bincount(self._book_codes, minlength=len(self._book_id_by_code))
+        self._book_sizes = {self._book_id_by_code[code]: int(counts[code]) for code in np.flatnonzero(counts)}
+
+    def _load_from_disk(self) -> bool:
+        vectors_path = os.path.join(self.index_dir, "vectors.npy")
+        ids_path = os.path.join(self.index_dir, "ids.npz")
+        if not (os.path.exists(vectors_path) and os.path.exists(ids_path)):
+            return False
+
+        try:
+            ids = np.load(ids_path)
+            if str(ids["engine"]) != self.engine.name or "synced_until" not in ids or not str(ids["synced_until"]):
+                return False
+
+            size = len(ids["chunk_ids"])
+            matrix = np.load(vectors_path)
+            if matrix.shape != (size, self.dimension) or not self.engine.load(self.index_dir, size):
+                return False
+        except Exception as e:
+            print(f"Warning: Could not read persisted vector index: {e}")
+            return False
+
+        with self._lock:
+            self._book_code_by_id, self._book_id_by_code = {}, []
+            book_codes = self._encode_books([str(book_id) for book_id in ids["book_ids"]])
+            self._replace_rows(matrix, [ObjectId(chunk_id) for chunk_id in ids["chunk_ids"]], book_codes)
+            self._synced_until = datetime.fromisoformat(str(ids["synced_until"]))
+            self._recently_synced = {}
+            self._dirty = False
+        return True
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+    @staticmethod
+    def _object_array(values: List[Any]) -> np.ndarray:
+        # Build element-wise so ObjectIds/strings never get broadcast into a 2D array
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+
+# Global vector index instance, populated on application startup
+vector_index = VectorIndex(
+    engine_name=os.getenv("VECTOR_INDEX_ENGINE", "flat"),
+    index_dir=os.getenv("VECTOR_INDEX_DIR", "vector_index")
+)
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Dict, Any, List, Tuple
+from services.murf_client import murf_client, MurfClient, SENTENCE_BOUNDARY
+from services.concurrency import UpstreamBusyError
+
+
+class SentenceGrouper:
+    def __init__(self, first_group_chars: int, group_chars: int):
+        """
+        Groups streamed text into complete sentences for speech synthesis
+        A group is released once it holds at least the minimum number of
+        characters; the first group is kept small so audio starts early
+        Args:
+            first_group_chars: Minimum size of the first group
+            group_chars: Minimum size of later groups
+        """
+        self.first_group_chars = first_group_chars
+        self.group_chars = group_chars
+        self.groups = 0
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentence_end = None
+        for match in SENTENCE_BOUNDARY.finditer(self._buffer):
+            sentence_end = match.end()
+        if sentence_end is None:
+            return []
+
+        complete = self._buffer[:sentence_end].strip()
+        if len(complete) < (self.group_chars if self.groups else self.first_group_chars):
+            return []
+        self._buffer = self._buffer[sentence_end:]
+        self.groups += 1
+        return [complete]
+
+    def finish(self) -> List[str]:
+        rest = self._buffer.strip()
+        self._buffer = ""
+        if not rest:
+            return []
+        self.groups += 1
+        return [rest]
+
+
+class VoicePipeline:
+    def __init__(self, murf: MurfClient, first_group_chars: int = 120, group_chars: int = 600):
+        """
+        Speaks an answer while it is still being generated
+        Streamed answer text is split into sentence groups and each group is
+        sent to TTS as soon as it is complete, so synthesis overlaps generation
+        Args:
+            murf: Murf client used for synthesis
+            first_group_chars: Minimum characters before the first group is synthesized
+            group_chars: Minimum characters for later groups
+        """
+        self.murf = murf
+        self.first_group_chars = first_group_chars
+        self.group_chars = group_chars
+
+    async def stream(
+        self,
+        answer_chunks: AsyncIterator[str],
+        voice_id: str,
+        prefix: str = "",
+        started: float = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yield ("token", ...) events as answer text arrives and ("audio", ...)
+        events in order as segments are synthesized, then one ("done", ...)
+        event with the full answer, the joined audio file and timings.
+        A failed generation yields ("error", ...) instead of "done"
+        Args:
+            answer_chunks: Streamed answer text
+            voice_id: Murf voice for the audio
+            prefix: Text spoken and sent before the answer
+            started: perf_counter() timings are measured from (defaults to now)
+        """
+        started = started or time.perf_counter()
+        events: asyncio.Queue = asyncio.Queue()
+        segment_tasks: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.murf.segment_concurrency)
+        grouper = SentenceGrouper(self.first_group_chars, self.group_chars)
+        answer_parts: List[str] = []
+        timing: Dict[str, Any] = {"first_token_ms": None, "first_audio_ms": None}
+
+        def elapsed_ms() -> float:
+            return round((time.perf_counter() - started) * 1000, 1)
+
+        async def synthesize(segment: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.murf.synthesize_segment(segment, voice_id)
+
+        def dispatch(groups: List[str]):
+            for group in groups:
+                for segment in self.murf.prepare_segments(group):
+                    segment_tasks.put_nowait(asyncio.create_task(synthesize(segment)))
+
+        async def generate():
+            try:
+                if prefix:
+                    answer_parts.append(prefix)
+                    await events.put(("token", {"text": prefix}))
+                    dispatch(grouper.feed(prefix))
+                async for text in answer_chunks:
+                    if timing["first_token_ms"] is None:
+                        timing["first_token_ms"] = elapsed_ms()
+                    answer_parts.append(text)
+                    await events.put(("token", {"text": text}))
+                    dispatch(grouper.feed(text))
+                dispatch(grouper.finish())
+            except UpstreamBusyError as e:
+                await events.put(("error", {"message": str(e), "retry_after": e.retry_after}))
+            except Exception as e:
+                await events.put(("error", {"message": f"Error generating response: {str(e)}"}))
+            finally:
+                segment_tasks.put_nowait(None)
+
+        async def collect_audio():
+            results = []
+            while True:
+                task = await segment_tasks.get()
+                if task is None:
+                    break
+                try:
+                    result = {"index": len(results), **(await task)}
+                except UpstreamBusyError as e:
+                    await events.put(("error", {"message": str(e), "retry_after": e.retry_after}))
+                    return
+                if timing["first_audio_ms"] is None:
+                    timing["first_audio_ms"] = elapsed_ms()
+                results.append(result)
+                await events.put(("audio", result))
+            await events.put(("audio_complete", {"results": results}))
+
+        generator = asyncio.create_task(generate())
+        collector = asyncio.create_task(collect_audio())
+        try:
+            while True:
+                event, data = await events.get()
+                if event == "error":
+                    yield event, data
+                    return
+                if event == "audio_complete":
+                    break
+                yield event, data
+
+            combined = await self.murf.combine_segments(data["results"], voice_id) if data["results"] else None
+            yield "done", {
+                "answer": "".join(answer_parts),
+                "audio": combined,
+                "timing": {**timing, "total_ms": elapsed_ms()}
+            }
+        finally:
+            generator.cancel()
+            collector.cancel()
+            while not segment_tasks.empty():
+                task = segment_tasks.get_nowait()
+                if task:
+                    task.cancel()
+
+
+# Global voice pipeline
+voice_pipeline = VoicePipeline(
+    murf_client,
+    first_group_chars=int(os.getenv("VOICE_FIRST_GROUP_CHARS", "120")),
+    group_chars=int(os.getenv("VOICE_GROUP_CHARS", "600"))
+) if murf_client else None
@@ -0,0 +1,79 @@
+"""
+Embedding worker: processes jobs queued by the API
+
+Usage:
+    python worker.py [--processes 2] [--poll-interval 2]
+
+Each process loads its own embedding model and claims jobs from the
+embedding_jobs collection, so encoding never competes with query traffic
+in the API process. Run as many processes as the box has spare cores for.
+
+The API only queues jobs: run this next to the API (same MONGODB_URL and
+EMBEDDING_BACKEND), or uploaded books are never embedded. See README.md
+for the environment variables.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+
+
+def run_worker(worker_number: int, poll_interval: float, threads_per_process: int):
+    # Split the cores between processes before torch/onnxruntime are imported
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads_per_process))
+
+    from services.job_queue import embedding_jobs, LeaseLostError
+    from services.embedding_pipeline import generate_embeddings_for_book
+
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{worker_number}"
+    print(f"Embedding worker {worker_id} started")
+
+    while True:
+        job = embedding_jobs.claim(worker_id)
+        if not job:
+            time.sleep(poll_interval)
+            continue
+
+        def keep_lease(*batch):
+            # Stop as soon as the job has been reclaimed by another worker
+            if not embedding_jobs.heartbeat(job["_id"], worker_id):
+                raise LeaseLostError(f"Job {job['_id']} was reclaimed")
+
+        print(f"Worker {worker_id} processing job {job['_id']} for book {job['book_id']} (attempt {job['attempts']})")
+        try:
+            chunks_embedded = generate_embeddings_for_book(job["book_id"], on_batch=keep_lease)
+            if not embedding_jobs.complete(job["_id"], worker_id, chunks_embedded):
+                raise LeaseLostError(f"Job {job['_id']} was reclaimed")
+        except LeaseLostError as e:
+            print(f"Worker {worker_id} lost its lease, abandoning: {e}")
+        except Exception as e:
+            traceback.print_exc()
+            embedding_jobs.fail(job, str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run embedding worker processes")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("EMBEDDING_WORKER_PROCESSES", "1")))
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        run_worker(0, args.poll_interval, os.cpu_count() or 1)
+        return
+
+    threads_per_process = max(1, (os.cpu_count() or 1) // args.processes)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(i, args.poll_interval, threads_per_process), daemon=True)
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()